@@ -0,0 +1,288 @@
+# vim:filetype=python:fileencoding=utf-8
+"""
+Usage
+
+    python benchmark.py [--seeds N] [--first-seed SEED] [--timeout SECONDS]
+                        [--leagues shipped,8,12,16,24] [--generator NAME]
+                        [--local-search NAME] [--rebalancer NAME]
+                        [--output FILE] [--compare FILE]
+
+Times the scheduler hot paths and the end-to-end time to the first valid
+schedule, and writes the results as JSON so runs can be compared across
+commits.
+
+Micro-benchmarks time single calls (pick_random_opponent, already_played,
+opponent_in_week, max_consecutive_home_or_away_games) and one sweep of
+rebalance_home_away on a fixed candidate of the shipped league.  Macro
+benchmarks solve each league once per seed and report the median and p95
+time to solution; the leagues are the shipped config.py and synthetic
+8/12/16/24-team leagues with the same rules.
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+import timeit
+
+import config
+from lib.errors import NoAvailableOpponnentError
+from lib.game import Game
+from lib.picker import pick_random_opponent_index
+from lib.rebalance import rebalance_home_away
+from lib.round_robin import round_robin_games
+from lib.league import LeagueConfig
+from lib.league_schedule import LeagueSchedule
+from lib.solver import Solver
+from lib.team import Team
+from lib.telemetry import Telemetry
+
+
+def synthetic_league(num_teams):
+    """ A league of num_teams real teams (plus the BY1/BY2 pseudo teams)
+        with the shipped rules: TAG and TAB share a field and must not
+        meet, week 1 has no byes, and every team gets one bye.  Solver
+        settings are those of config.py.
+    """
+    if num_teams % 2 or num_teams < 4:
+        raise ValueError('Synthetic leagues need an even number of teams (at least 4)')
+    abbrevs = ['TAG', 'TAB'] + ['T%02d' % (i + 1) for i in range(num_teams - 2)]
+    teams = dict((a, Team(a, 'B')) for a in abbrevs)
+    teams['BY1'] = Team('BY1', '-', bye=True)
+    teams['BY2'] = Team('BY2', '-', bye=True)
+    # odd, so each team has one bye and an even number of games
+    number_weeks = num_teams // 2 + 3
+    overrides = [
+        dict(team='BY1', week=1, force_home=True, force_opponent='BY2'),
+        dict(team='TAG', avoid_opponent='TAB'),
+    ]
+    return LeagueConfig.from_module(
+        config, teams=teams, number_weeks=number_weeks, overrides=overrides, shared_fields=[('TAG', 'TAB')],
+        max_cross_division_games=None, crossover_quotas=None, field_capacity=(), required_matchups=(),
+        blackout_weeks=None, max_rebalance_home_away_iterations=None)
+
+
+def _percentile(values, p):
+    """ Nearest-rank percentile of the given values, or None if empty """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, int(math.ceil(p / 100.0 * len(values))) - 1)]
+
+
+def _median(values):
+    if not values:
+        return None
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def candidate_schedule(league, seed, weeks=None):
+    """ A complete (round robin) candidate of the league before
+        rebalancing, optionally holding only the given number of weeks.
+    """
+    rng = random.Random(seed)
+    games = [g for g in round_robin_games(list(league.teams), league.constraints.bye_teams,
+                                         league.number_weeks, league.override_index, rng,
+                                         require_bye=league.require_bye, constraints=league.constraints)
+             if weeks is None or g[2] <= weeks]
+    schedule = LeagueSchedule(league)
+    for home, away, week, forced, bye in games:
+        schedule.add(Game(league.teams[home], league.teams[away], week, forced=forced, is_bye=bye))
+    return schedule
+
+
+def _time_per_call(fn, calls, repeat):
+    """ Time fn, which makes the given number of calls, returning the
+        median and best seconds per call over repeat runs.
+    """
+    runs = [t / calls for t in timeit.Timer(fn).repeat(repeat=repeat, number=1)]
+    return dict(median=_median(runs), min=min(runs), calls=calls, repeat=repeat)
+
+
+def run_micro(league, seed, repeat=7):
+    """ Time the hot queries on a fixed candidate of the league """
+    schedule = candidate_schedule(league, seed)
+    partial = candidate_schedule(league, seed, weeks=league.number_weeks // 2)
+    teams = list(league.teams.values())
+    abbrevs = list(league.teams)
+    weeks = range(1, league.number_weeks + 1)
+    rng = random.Random(seed)
+
+    everyone = (1 << len(teams)) - 1
+
+    def pick():
+        for i in range(len(teams)):
+            try:
+                pick_random_opponent_index(partial, i, everyone, rng)
+            except NoAvailableOpponnentError:
+                pass
+
+    def already_played():
+        for a in teams:
+            for b in teams:
+                schedule.already_played(a, b)
+
+    def opponent_in_week():
+        for abbrev in abbrevs:
+            for week in weeks:
+                schedule.opponent_in_week(abbrev, week)
+
+    def max_consecutive():
+        for abbrev in abbrevs:
+            schedule.max_consecutive_home_or_away_games(abbrev)
+
+    results = dict(
+        pick_random_opponent=_time_per_call(pick, len(teams), repeat),
+        already_played=_time_per_call(already_played, len(teams) ** 2, repeat),
+        opponent_in_week=_time_per_call(opponent_in_week, len(abbrevs) * len(weeks), repeat),
+        max_consecutive_home_or_away_games=_time_per_call(max_consecutive, len(abbrevs), repeat),
+    )
+
+    # one sweep over every team, each on a fresh copy of the candidate
+    sweeps = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(repeat):
+            fresh = candidate_schedule(league, seed)
+            start = time.perf_counter()
+            rebalance_home_away(fresh, 1, random.Random(seed + i))
+            sweeps.append(time.perf_counter() - start)
+    results['rebalance_home_away_sweep'] = dict(median=_median(sweeps), min=min(sweeps), calls=1, repeat=repeat)
+    return results
+
+
+def run_macro(league, seeds, timeout, generator=None, local_search=None, rebalancer=None):
+    """ Solve the league once per seed, returning per-run results and the
+        median/p95 time to the first valid schedule.  A run still going
+        after timeout seconds is stopped at its next attempt and counted
+        as unsolved; the statistics cover solved runs only.  Settings
+        not given are the league's.
+    """
+    runs = []
+    with open(os.devnull, 'w') as devnull:
+        for seed in seeds:
+            stop_event = threading.Event()
+            timer = threading.Timer(timeout, stop_event.set)
+            telemetry = Telemetry()
+            solver = Solver(league)
+            timer.start()
+            start = time.perf_counter()
+            try:
+                with contextlib.redirect_stdout(devnull):
+                    schedule, attempts = solver.make_schedule(seed=seed, stop_event=stop_event,
+                                                              generator=generator, local_search=local_search,
+                                                              rebalancer=rebalancer, telemetry=telemetry)
+            finally:
+                timer.cancel()
+            snapshot = telemetry.snapshot(final=True)
+            runs.append(dict(seed=seed, seconds=time.perf_counter() - start, attempts=attempts,
+                             solved=schedule is not None, outcomes=snapshot['outcomes'],
+                             stage_seconds=snapshot['stage_seconds']))
+
+    solved = [r['seconds'] for r in runs if r['solved']]
+    return dict(
+        teams=len([t for t in league.teams.values() if not t.is_pseudo_team_bye()]),
+        weeks=league.number_weeks,
+        solved=len(solved),
+        median=_median(solved),
+        p95=_percentile(solved, 95),
+        runs=runs,
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """ Print old vs. new timings side by side (ratio < 1 is faster) """
+    def row(name, a, b):
+        if a is None or b is None:
+            print("%-40s %12s %12s" % (name, a, b))
+        else:
+            print("%-40s %12.3g %12.3g %7.2fx" % (name, a, b, b / a))
+
+    print("%-40s %12s %12s %8s" % ('benchmark (seconds)', (old.get('commit') or '?')[:10],
+                                   (new.get('commit') or '?')[:10], 'ratio'))
+    for name, result in sorted(new['micro'].items()):
+        if name in old.get('micro', {}):
+            row(name, old['micro'][name]['median'], result['median'])
+    for league, result in sorted(new['macro'].items()):
+        if league in old.get('macro', {}):
+            for stat in ('median', 'p95'):
+                row('%s %s' % (league, stat), old['macro'][league][stat], result[stat])
+
+
+if __name__ == '__main__':
+    shipped = LeagueConfig.from_module(config)
+    solver = Solver(shipped)
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[2])
+    parser.add_argument('--seeds', type=int, default=10,
+                        help='number of seeds to solve each league with (default: %(default)s)')
+    parser.add_argument('--first-seed', type=int, default=1,
+                        help='first seed; the others follow it (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='seconds before a run is stopped (at its next attempt) as unsolved (default: %(default)s)')
+    parser.add_argument('--leagues', default='shipped,8,12,16,24',
+                        help='comma separated leagues: "shipped" or a team count (default: %(default)s)')
+    parser.add_argument('--generator', choices=sorted(solver.generators), default=shipped.generator,
+                        help='how candidate schedules are generated (default: %(default)s)')
+    parser.add_argument('--local-search', choices=sorted(solver.local_searches), default=shipped.local_search,
+                        help='repair candidates by local search instead of rebalancing home/away')
+    parser.add_argument('--rebalancer', choices=sorted(solver.rebalancers), default=shipped.rebalancer,
+                        help='home/away rebalancer to solve with (default: %(default)s)')
+    parser.add_argument('--output', default='benchmark.json',
+                        help='file to write the JSON results to (default: %(default)s)')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='earlier results to compare against')
+    args = parser.parse_args()
+
+    seeds = list(range(args.first_seed, args.first_seed + args.seeds))
+    results = dict(
+        commit=git_commit(),
+        date=datetime.datetime.now().isoformat(timespec='seconds'),
+        python=platform.python_version(),
+        generator=args.generator,
+        local_search=args.local_search,
+        rebalancer=args.rebalancer,
+        seeds=seeds,
+        timeout=args.timeout,
+        micro=run_micro(shipped, args.first_seed),
+        macro={},
+    )
+    for name, result in sorted(results['micro'].items()):
+        print("%-40s %10.2f us/call" % (name, result['median'] * 1e6))
+
+    for league in args.leagues.split(','):
+        name = league if league == 'shipped' else '%s_teams' % league
+        league = shipped if league == 'shipped' else synthetic_league(int(league))
+        result = run_macro(league, seeds, args.timeout, generator=args.generator,
+                           local_search=args.local_search, rebalancer=args.rebalancer)
+        results['macro'][name] = result
+        if result['solved']:
+            print("%-40s solved %s/%s  median %.2fs  p95 %.2fs" % (
+                name, result['solved'], len(seeds), result['median'], result['p95']))
+        else:
+            print("%-40s solved 0/%s" % (name, len(seeds)))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print("Results written to %s" % args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
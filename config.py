@@ -13,6 +13,12 @@ max_consecutive_home_away_game_limit = 3
 
 debug = False
 
+# How candidate schedules are generated:
+#   'random'      - pick opponents greedily week by week (may dead-end)
+#   'round_robin' - permute a round robin table to fit the overrides
+#   'backtrack'   - fill weeks by backtracking search, undoing dead ends
+generator = 'random'
+
 teams = dict(
     TAB=Team('TAB', 'B'),
     TAG=Team('TAG', 'B'),
@@ -28,8 +34,17 @@ teams = dict(
     MAN=Team('MAN', 'B'),
 
     # Byes
-    BY1=Team('BY1', '-'),
-    BY2=Team('BY2', '-'),
+    BY1=Team('BY1', '-', bye=True),
+    BY2=Team('BY2', '-', bye=True),
+
+    # A team that can only play away games:
+    # PRM=Team('PRM', 'C', never_home=True),
+
+    # Several divisions can be scheduled in one search: add the teams of
+    # each division (keyed CLUB-DIVISION, e.g. TAB-C, with their club),
+    # and see crossover_quotas and field_capacity below.  With
+    # `from lib.team import division_teams` added above:
+    # **division_teams('C', ['TAB', 'CHI', 'ELL', 'NRT', 'BAR', 'MAN']),
 )
 
 # Weeks
@@ -68,18 +83,79 @@ overrides = [
     # Streetsboro away 9/9
     dict(team='STR', week=4, force_away=True),
 
-    # Ravenna/Woodridge/Chippewa should play (no C JVs)
-    # TODO:
+    # Ravenna/Woodridge/Chippewa should play (no C JVs): see required_matchups
 
     # Tallmadge should not play itself
     dict(team='TAG', avoid_opponent='TAB'),
 ]
 
+# League-wide rules; overrides and rules are parsed, checked and compiled
+# once when the league is loaded (lib/league.py), so a malformed or
+# conflicting setting raises ValueError then
+
+# Teams sharing a home field: no two of a group are home in the same week
+shared_fields = [
+    ('TAG', 'TAB'),
+]
+
+# Most games a team may play against other divisions (None: no limit)
+max_cross_division_games = None
+
+# Most games a team may play against one other division, e.g.
+# {('B', 'C'): 2}; divisions not paired here never meet (None: any
+# divisions may meet, up to max_cross_division_games)
+crossover_quotas = None
+
+# Home games a site can host in one week across all divisions, as
+# (clubs, capacity) pairs, e.g. [(('TAB', 'TAG'), 3)] for Overdale
+field_capacity = []
+
+# Matchups that must be played in some week
+required_matchups = [
+    # ('RAV', 'WOD'),
+    # ('RAV', 'CHI'),
+    # ('WOD', 'CHI'),
+]
+
+# Weeks a team cannot play (it takes its bye then), e.g. dict(CHI=[3])
+blackout_weeks = {}
+
 # number of random schedules to generate before giving up
 max_outer_loop_iterations = 15000000
 
+# seconds between progress messages while searching (None: no heartbeat)
+progress_interval = None
+
 # number of attempts to rebalance home/away within a given schedule
 # before giving up and trying a new randomly generated one
 # cutting this back because it seems to either get it pretty quickly or never at all
 # max_rebalance_home_away_iterations = 50 * ((len(teams) * number_weeks) ** 2) #500000
 max_rebalance_home_away_iterations = ((len(teams) * number_weeks) ** 2)
+
+# How the home/away rebalancer balances a candidate:
+#   'flow'  - exact balanced orientation by max flow (or proof there is
+#             none), then a local pass for streaks and shared fields
+#             (lib/orient.py)
+#   'sweep' - random home/away swaps until balanced (lib/rebalance.py)
+rebalancer = 'flow'
+
+# number of local repair steps after a flow orientation before giving up
+max_orient_repair_steps = 200
+
+# Repair step used instead of the home/away rebalancer:
+#   None     - rebalance home/away only (lib/rebalance.py)
+#   'anneal' - simulated annealing over home/away flips, opponent swaps
+#              and week swaps (lib/anneal.py); also fixes byes/pairings
+local_search = None
+
+# number of simulated annealing steps per candidate before giving up
+max_local_search_steps = 20000
+
+# Exact solver (python schedule.py --exact):
+#   'auto'   - CP-SAT if the optional ortools package is installed, else 'python'
+#   'cpsat'  - CP-SAT (pip install ortools); proves infeasibility in seconds
+#   'python' - pure-Python complete search; proves conflicts it can isolate
+exact_backend = 'auto'
+
+# seconds CP-SAT may spend on one solve
+exact_time_limit = 60
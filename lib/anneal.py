@@ -0,0 +1,164 @@
+import logging
+import math
+
+from lib.byes import is_bye
+
+log = logging.getLogger(__name__)
+
+
+# Relative cost of each kind of rule violation
+penalty_weights = dict(
+    balance=10,       # each home game above/below the balanced count
+    streak=5,         # each game past the consecutive home/away limit
+    shared_field=10,  # each week a shared field has too many home teams
+    bye=20,           # each bye more or less than one
+    avoid=50,         # each avoided matchup that is played
+)
+
+
+class Penalty:
+    """ Weighted penalty of a complete schedule, kept up to date
+        incrementally: per-team terms are recomputed only for the teams a
+        move touched, and the (small) league-wide terms are recomputed
+        after every move.  A penalty of 0 means the schedule is valid.
+        The rules are those of the schedule's league.
+    """
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.league = league = schedule.league
+        self.teams = [t for t in schedule.teams if not schedule.teams[t].is_pseudo_team_bye()]
+        self.home_bounds = (int(math.floor(league.number_weeks / 2.0)), int(math.ceil(league.number_weeks / 2.0)))
+        self.avoid_pairs = league.override_index.avoided_pairs()
+        self.team_penalties = dict((t, self.team_penalty(t)) for t in self.teams)
+        self.total = sum(self.team_penalties.values()) + self.league_penalty()
+
+    def team_penalty(self, team):
+        schedule = self.schedule
+        limit = self.league.max_consecutive_home_away_game_limit
+        penalty = 0
+        if not schedule.teams[team].never_home:
+            # teams that are always away are exempt from balance and streaks
+            home = schedule.home_game_count_for_team(team)
+            lo, hi = self.home_bounds
+            penalty += penalty_weights['balance'] * (max(0, lo - home) + max(0, home - hi))
+        if limit and not schedule.teams[team].never_home:
+            streak = schedule.max_consecutive_home_or_away_games(team)
+            penalty += penalty_weights['streak'] * max(0, streak - limit)
+        if self.league.require_bye:
+            byes = schedule.bye_counts[schedule.team_index[team]]
+            penalty += penalty_weights['bye'] * abs(byes - 1)
+        return penalty
+
+    def league_penalty(self):
+        schedule = self.schedule
+        constraints = self.league.constraints
+        penalty = 0
+        for group_mask, capacity in constraints.fields:
+            weeks = constraints.shared_field_weeks(schedule, group_mask, capacity)
+            penalty += penalty_weights['shared_field'] * len(weeks)
+        for a, b in self.avoid_pairs:
+            if schedule.contains_matchup(a, b):
+                penalty += penalty_weights['avoid']
+        return penalty
+
+    def update(self, teams=None):
+        """ Refresh after a move touching the given teams (default: all) """
+        for t in (self.teams if teams is None else teams):
+            if t in self.team_penalties:
+                self.team_penalties[t] = self.team_penalty(t)
+        self.total = sum(self.team_penalties.values()) + self.league_penalty()
+        return self.total
+
+
+def _natural(game):
+    """ Only games whose bye status follows from their teams may be re-paired """
+    return not game.forced and game.is_bye == is_bye(game.home, game.away)
+
+
+class _Moves:
+    """ The neighbourhood of a complete schedule.  Every move returns the
+        teams it touched and an undo callable, or None if it was not
+        applicable.
+    """
+
+    def __init__(self, schedule, rng):
+        self.schedule = schedule
+        self.rng = rng
+        self.games = schedule.games
+
+    def flip(self):
+        g = self.rng.choice(self.games)
+        if g.forced or g.is_bye or g.home.never_home or g.away.never_home:
+            return None
+        g.swap()
+        return (g.home.abbrev, g.away.abbrev), g.swap
+
+    def swap_opponents(self):
+        schedule = self.schedule
+        week = self.rng.randint(1, schedule.num_weeks)
+        games = [g for g in self.games if g.week == week]
+        if len(games) < 2:
+            return None
+        g1, g2 = self.rng.sample(games, 2)
+        if not (_natural(g1) and _natural(g2)):
+            return None
+        cross = self.rng.random() < 0.5
+        if cross:
+            new_pairs = ((g1.home, g2.home), (g1.away, g2.away))
+        else:
+            new_pairs = ((g1.home, g2.away), (g2.home, g1.away))
+        for a, b in new_pairs:
+            if schedule.already_played(a, b):
+                return None
+        # cross makes g1's away team the home team of g2
+        if g1.home.never_home or g2.home.never_home or (cross and g1.away.never_home):
+            return None
+        touched = (g1.home.abbrev, g1.away.abbrev, g2.home.abbrev, g2.away.abbrev)
+        schedule.swap_opponents(g1, g2, cross=cross)
+        return touched, lambda: schedule.swap_opponents(g1, g2, cross=cross)
+
+    def swap_weeks(self):
+        schedule = self.schedule
+        week1, week2 = self.rng.sample(range(1, schedule.num_weeks + 1), 2)
+        for g in self.games:
+            if g.week in (week1, week2) and g.forced:
+                return None
+        schedule.swap_weeks(week1, week2)
+        return None, lambda: schedule.swap_weeks(week1, week2)
+
+
+def anneal_schedule(schedule, rng, max_steps, start_temperature=5.0, end_temperature=0.05):
+    """ Repair a complete schedule in place by simulated annealing over
+        home/away flips, opponent swaps between two games of the same
+        week, and whole-week swaps.  Worse moves are accepted with
+        probability exp(-delta / temperature), the temperature falling
+        geometrically over max_steps.  Forced games are never changed.
+
+        Returns True once the penalty reaches 0 (the schedule is valid),
+        False if it is still invalid after max_steps.
+    """
+    penalty = Penalty(schedule)
+    moves = _Moves(schedule, rng)
+    neighbourhood = [moves.flip] * 6 + [moves.swap_opponents] * 3 + [moves.swap_weeks]
+    cooling = (end_temperature / start_temperature) ** (1.0 / max(1, max_steps))
+    temperature = start_temperature
+
+    for i in range(max_steps):
+        if penalty.total == 0:
+            return True
+        if schedule.league.debug and (i % 1000 == 0):
+            log.debug("Annealing step %s, penalty %s", i, penalty.total)
+        temperature *= cooling
+
+        move = rng.choice(neighbourhood)()
+        if move is None:
+            continue
+        touched, undo = move
+        before = penalty.total
+        delta = penalty.update(touched) - before
+        if delta > 0 and rng.random() >= math.exp(-delta / temperature):
+            undo()
+            penalty.update(touched)
+
+    return penalty.total == 0
@@ -0,0 +1,30 @@
+import json
+
+
+def schedule_games(schedule):
+    """ The games of a schedule as artifact records, week by week: the
+        division, week, home and away club and whether the game was
+        forced by an override (plus away_division for a game between
+        two divisions).  Byes are left out.
+    """
+    for game in sorted(schedule.games, key=lambda g: (g.week, g.home.abbrev)):
+        if game.is_bye:
+            continue
+        record = dict(division=game.home.division, week=game.week, home=game.home.club,
+                      away=game.away.club, forced=bool(game.forced))
+        if game.away.division != game.home.division:
+            record['away_division'] = game.away.division
+        yield record
+
+
+def write_games(games, stream):
+    """ Write game records to stream as JSON lines, one game per line """
+    for game in games:
+        stream.write(json.dumps(game, sort_keys=True) + '\n')
+
+
+def read_games(stream):
+    """ Yield the game records of a JSON lines artifact one at a time """
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
@@ -0,0 +1,284 @@
+from lib.errors import CannotFulfillOverride, NoAvailableOpponnentError
+from lib.round_robin import orient_pairings
+
+
+def _bits(mask):
+    """ Indexes of the set bits in mask """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+class WeekFiller:
+    """ Depth-first search that fills each week as a matching of the
+        teams, always extending the team with the fewest remaining
+        opponents next (so a team left with none is caught right after
+        the choice that caused it) and undoing only the latest choices
+        when it hits a dead end.
+
+        Teams are integer indexes; "already played", avoided opponents and
+        the free teams of a week are all bitmasks.  Forced and avoided
+        matchups come from override_index (lib/overrides.py); with
+        constraints (lib/constraints.py), teams take their byes in their
+        blackout weeks, matchups past a cross-division limit or crossover
+        quota are never picked, and required matchups are picked first and
+        must all fit in the weeks left.  Subclasses
+        can also decide home/away during the search by overriding
+        _orientations, _snapshot/_place/_restore and _week_done.
+    """
+
+    def __init__(self, team_abbrevs, number_weeks, override_index, rng, require_bye, max_nodes, bye_teams,
+                 constraints=None):
+        self.abbrevs = list(team_abbrevs)
+        self.index = dict((t, i) for i, t in enumerate(self.abbrevs))
+        self.number_weeks = number_weeks
+        self.rng = rng
+        self.require_bye = require_bye
+        self.max_nodes = max_nodes
+        self.nodes = 0
+
+        n = len(self.abbrevs)
+        self.all_mask = (1 << n) - 1
+        self.pseudo_mask = 0
+        pseudo = set(bye_teams)
+        for i, t in enumerate(self.abbrevs):
+            if t in pseudo:
+                self.pseudo_mask |= 1 << i
+        self.real_mask = self.all_mask & ~self.pseudo_mask
+        self.num_pseudo = _popcount(self.pseudo_mask)
+
+        self.avoid = [0] * n
+        self.forced_pairs = [[] for _ in range(number_weeks)]
+        self.week_avoid = [[0] * n for _ in range(number_weeks)]
+        self.must_play = [self.real_mask] * number_weeks
+        for a, b in override_index.avoided_pairs():
+            self.avoid[self.index[a]] |= 1 << self.index[b]
+            self.avoid[self.index[b]] |= 1 << self.index[a]
+        for w in range(number_weeks):
+            for a, avoid in override_index.avoid_by_week[w].items():
+                for b in avoid:
+                    self.week_avoid[w][self.index[a]] |= 1 << self.index[b]
+            # two teams forced home (or both forced away) can't meet that week
+            venues = {}
+            for g in override_index.by_week[w]:
+                t = self.index[g.team.abbrev]
+                self.must_play[w] |= 1 << t
+                if g.opponent is None:
+                    venues.setdefault(g.home, []).append(t)
+                    continue
+                a = self.index[g.opponent.abbrev]
+                self.forced_pairs[w].append((t, a) if g.home else (a, t))
+                # propagate: a forced matchup can't be picked in any other week
+                self.avoid[t] |= 1 << a
+                self.avoid[a] |= 1 << t
+            for group in venues.values():
+                for t in group:
+                    for a in group:
+                        if a != t:
+                            self.week_avoid[w][t] |= 1 << a
+
+        # blacked out teams take their bye that week, and if they get
+        # only one, not before it
+        self.blackout = [0] * number_weeks
+        self.required = [0] * n
+        self.has_required = False
+        # cross_limits[t] holds t's (opponents mask, most games) caps, and
+        # limited_by[t] the (team, opponents mask, most games) caps of
+        # other teams that count games against t
+        self.cross_limits = [[] for _ in range(n)]
+        self.limited_by = [[] for _ in range(n)]
+        if constraints is not None:
+            self.blackout = [self.mask(constraints.abbrevs(mask)) for mask in constraints.blackout[:number_weeks]]
+            if constraints.limits_crossovers:
+                for i, t in enumerate(constraints.teams):
+                    own = constraints.division_of[i]
+                    if own < 0:
+                        continue
+                    limits = []
+                    if constraints.max_cross_division_games is not None:
+                        limits.append((constraints.cross_division[i], constraints.max_cross_division_games))
+                    for d, limit in enumerate(constraints.crossover_limit[own]):
+                        if d != own and limit is not None:
+                            limits.append((constraints.division_masks[d], limit))
+                    j = self.index[t]
+                    self.cross_limits[j] = [(self.mask(constraints.abbrevs(mask)), limit) for mask, limit in limits]
+                for j, limits in enumerate(self.cross_limits):
+                    for opponents, limit in limits:
+                        for t in _bits(opponents):
+                            self.limited_by[t].append((j, opponents, limit))
+            for i, j in constraints.required_pairs:
+                a, b = self.index[constraints.teams[i]], self.index[constraints.teams[j]]
+                self.required[a] |= 1 << b
+                self.required[b] |= 1 << a
+                self.has_required = True
+        self.later_blackout = [0] * number_weeks
+        for w in range(number_weeks - 2, -1, -1):
+            self.later_blackout[w] = self.later_blackout[w + 1] | self.blackout[w + 1]
+
+        self.played = [0] * n
+        self.bye_mask = 0
+        self.weeks = [None] * number_weeks
+
+    def mask(self, abbrevs):
+        mask = 0
+        for t in abbrevs:
+            mask |= 1 << self.index[t]
+        return mask
+
+    def _snapshot(self):
+        return self.bye_mask
+
+    def _place(self, w, home, away):
+        self.played[home] |= 1 << away
+        self.played[away] |= 1 << home
+        if (self.pseudo_mask >> home & 1) != (self.pseudo_mask >> away & 1):
+            self.bye_mask |= (1 << home | 1 << away) & self.real_mask
+
+    def _restore(self, home, away, snapshot):
+        self.played[home] &= ~(1 << away)
+        self.played[away] &= ~(1 << home)
+        self.bye_mask = snapshot
+
+    def _orientations(self, w, a, b):
+        """ (home, away) orders to try for a pairing; home/away is left to
+            orient_pairings here, so any order will do.
+        """
+        return [(a, b)]
+
+    def _week_done(self, w):
+        """ Prune once week w is complete """
+        weeks_left = self.number_weeks - w - 1
+        if self.require_bye:
+            needing = _popcount(self.real_mask & ~self.bye_mask)
+            if needing > weeks_left * self.num_pseudo:
+                return False
+        if self.has_required:
+            for t in _bits(self.real_mask):
+                if _popcount(self.required[t] & ~self.played[t]) > weeks_left:
+                    return False
+        return True
+
+    def _excluded(self, w, t):
+        """ Real teams real team t may not meet in week w: all of them
+            when t is blacked out, else the blacked out ones and those
+            a cross-division limit of t (or of theirs) rules out
+        """
+        if self.blackout[w] >> t & 1:
+            return self.real_mask
+        excluded = self.blackout[w]
+        for opponents, limit in self.cross_limits[t]:
+            if _popcount(self.played[t] & opponents) >= limit:
+                excluded |= opponents
+        for j, opponents, limit in self.limited_by[t]:
+            if _popcount(self.played[j] & opponents) >= limit:
+                excluded |= 1 << j
+        return excluded & self.real_mask
+
+    def _candidates(self, w, t, free):
+        mask = free & ~self.played[t] & ~self.avoid[t] & ~self.week_avoid[w][t] & ~(1 << t)
+        if self.pseudo_mask >> t & 1:
+            # pseudo teams only give byes to real teams without one, or
+            # to blacked out ones if a team may have several
+            if self.require_bye:
+                return mask & self.real_mask & ~self.bye_mask & ~self.later_blackout[w]
+            return mask & self.real_mask & (~self.bye_mask | self.blackout[w])
+        if self.bye_mask >> t & 1 and (self.require_bye or not self.blackout[w] >> t & 1):
+            mask &= self.real_mask
+        elif self.require_bye and self.later_blackout[w] >> t & 1:
+            mask &= self.real_mask
+        else:
+            mask &= self.real_mask | self.pseudo_mask
+        return mask & ~self._excluded(w, t)
+
+    def fill_week(self, w):
+        if w == self.number_weeks:
+            return True
+        return self._place_forced(w, 0, self.all_mask, [])
+
+    def _place_forced(self, w, i, free, pairs):
+        """ Place the forced matchups of week w, then the free picks """
+        if i == len(self.forced_pairs[w]):
+            return self._match(w, free, pairs)
+        a, b = self.forced_pairs[w][i]
+        if not (free >> a & 1 and free >> b & 1) or self.played[a] >> b & 1:
+            return False
+        if self.real_mask >> a & 1 and self._excluded(w, a) >> b & 1:
+            return False
+        for home, away in self._orientations(w, a, b):
+            snapshot = self._snapshot()
+            self._place(w, home, away)
+            pairs.append((home, away))
+            if self._place_forced(w, i + 1, free & ~(1 << a | 1 << b), pairs):
+                return True
+            pairs.pop()
+            self._restore(home, away, snapshot)
+        return False
+
+    def _match(self, w, free, pairs):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise NoAvailableOpponnentError(
+                'Backtracking gave up after %s nodes in week %s' % (self.max_nodes, w + 1))
+
+        remaining = self.must_play[w] & free
+        if not remaining:
+            if not self._week_done(w):
+                return False
+            self.weeks[w] = list(pairs)
+            return self.fill_week(w + 1)
+
+        # forward check: pick the most constrained team, fail if any has none
+        best, best_mask, best_count = None, 0, None
+        for t in _bits(remaining):
+            mask = self._candidates(w, t, free)
+            count = _popcount(mask)
+            if count == 0:
+                return False
+            if best_count is None or count < best_count:
+                best, best_mask, best_count = t, mask, count
+
+        options = list(_bits(best_mask))
+        self.rng.shuffle(options)
+        if self.required[best] & best_mask:
+            options.sort(key=lambda o: not self.required[best] >> o & 1)
+        for o in options:
+            for home, away in self._orientations(w, best, o):
+                snapshot = self._snapshot()
+                self._place(w, home, away)
+                pairs.append((home, away))
+                if self._match(w, free & ~(1 << best | 1 << o), pairs):
+                    return True
+                pairs.pop()
+                self._restore(home, away, snapshot)
+        return False
+
+
+def backtrack_games(team_abbrevs, bye_teams, number_weeks, override_index, rng, require_bye=True, max_nodes=20000,
+                    constraints=None):
+    """ Build a complete pairing for every week by backtracking search
+        (see WeekFiller).  Forced matchups are placed before any free
+        picks, and avoided matchups are never picked.  If require_bye,
+        every real team gets exactly one bye.  With constraints, blackout
+        weeks and required matchups are kept too.
+
+        Returns a list of (home, away, week, forced, is_bye) tuples, with
+        home/away picked at random unless an override fixes the venue.
+        Raises NoAvailableOpponnentError if the search exceeds max_nodes,
+        or CannotFulfillOverride if it proves no pairing exists.
+    """
+    filler = WeekFiller(team_abbrevs, number_weeks, override_index, rng, require_bye, max_nodes, bye_teams=bye_teams,
+                        constraints=constraints)
+    if not filler.fill_week(0):
+        raise CannotFulfillOverride('No pairing satisfies the overrides')
+
+    abbrevs = filler.abbrevs
+    weeks = [[(abbrevs[a], abbrevs[b]) for a, b in pairs] for pairs in filler.weeks]
+    games = orient_pairings(weeks, override_index, rng)
+    if games is None:
+        raise CannotFulfillOverride('No orientation satisfies the overrides')
+    return games
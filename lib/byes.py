@@ -1,62 +1,139 @@
-from config import number_weeks, teams
+import logging
+from collections import deque
+
+log = logging.getLogger(__name__)
 
 
 def is_bye(team, opponent):
     return team.is_pseudo_team_bye() or opponent.is_pseudo_team_bye()
 
 
-def add_bye_if_needed(schedule):
-    if number_weeks % 2 == 0:
-        return
-    needs_bye = []
-    for team in teams:
-        if team.startswith('BY'):  # BYE
+def _maximum_matching(adjacent):
+    """ Maximum matching of a general graph (adjacent[v] lists the
+        neighbours of node v) by Edmonds' blossom algorithm: augmenting
+        paths are grown breadth first from each unmatched node, and odd
+        cycles are contracted to their base as they are found.  O(V^3).
+
+        Returns mate, where mate[v] is the node v is matched to or -1.
+    """
+    n = len(adjacent)
+    mate = [-1] * n
+
+    def common_base(a, b, base, parent):
+        seen = [False] * n
+        while True:
+            a = base[a]
+            seen[a] = True
+            if mate[a] == -1:
+                break
+            a = parent[mate[a]]
+        while True:
+            b = base[b]
+            if seen[b]:
+                return b
+            b = parent[mate[b]]
+
+    def mark_path(v, b, child, base, parent, blossom):
+        while base[v] != b:
+            blossom[base[v]] = blossom[base[mate[v]]] = True
+            parent[v] = child
+            child = mate[v]
+            v = parent[mate[v]]
+
+    def find_path(root):
+        used = [False] * n
+        parent = [-1] * n
+        base = list(range(n))
+        used[root] = True
+        queue = deque([root])
+        while queue:
+            v = queue.popleft()
+            for u in adjacent[v]:
+                if base[v] == base[u] or mate[v] == u:
+                    continue
+                if u == root or (mate[u] != -1 and parent[mate[u]] != -1):
+                    b = common_base(v, u, base, parent)
+                    blossom = [False] * n
+                    mark_path(v, b, u, base, parent, blossom)
+                    mark_path(u, b, v, base, parent, blossom)
+                    for i in range(n):
+                        if blossom[base[i]]:
+                            base[i] = b
+                            if not used[i]:
+                                used[i] = True
+                                queue.append(i)
+                elif parent[u] == -1:
+                    parent[u] = v
+                    if mate[u] == -1:
+                        return u, parent
+                    used[mate[u]] = True
+                    queue.append(mate[u])
+        return -1, parent
+
+    for root in range(n):
+        if mate[root] != -1:
             continue
-        if not schedule.has_bye(team):
-            needs_bye.append(team)
+        v, parent = find_path(root)
+        while v != -1:
+            p = parent[v]
+            next_v = mate[p]
+            mate[v] = p
+            mate[p] = v
+            v = next_v
+    return mate
 
-    if len(needs_bye) == 2:
-        g = schedule.contains_matchup(*needs_bye)
-        if g and not g.forced:
-            g.is_bye = True
-            print('Changing game %s to bye' % g)
-            return
 
-    if len(needs_bye) == 4:
-        g = schedule.contains_matchup(needs_bye[0], needs_bye[1])
-        if g and not g.forced:
-            g.is_bye = True
-            print('Changing game %s to bye' % g)
-            g = schedule.contains_matchup(needs_bye[2], needs_bye[3])
-            if g and not g.forced:
-                g.is_bye = True
-                print('Changing game %s to bye' % g)
-                return
-            else:
-                print('Unable to add bye for %s', needs_bye)
-                return
-        g = schedule.contains_matchup(needs_bye[0], needs_bye[2])
-        if g and not g.forced:
-            g.is_bye = True
-            print('Changing game %s to bye' % g)
-            g = schedule.contains_matchup(needs_bye[1], needs_bye[3])
-            if g and not g.forced:
-                g.is_bye = True
-                print('Changing game %s to bye' % g)
-                return
-            else:
-                print('Unable to add bye for %s', needs_bye)
-                return
-        g = schedule.contains_matchup(needs_bye[0], needs_bye[3])
-        if g and not g.forced:
+def add_bye_if_needed(schedule, byes=1):
+    """ Give every real team with fewer than byes byes the rest of them,
+        by turning games between two such teams into byes for both.
+
+        Each team short of byes must have exactly as many of its
+        non-forced games against other such teams (schedule.games_by_team)
+        chosen as it is short, so the games are a perfect b-matching of
+        that graph.  It is reduced to a perfect matching the usual way:
+        a team short of k byes becomes k nodes, and each game (u, v)
+        becomes two joined nodes, one joined to the nodes of u and the
+        other to those of v.  A game is turned into a bye when its nodes
+        are matched to its teams rather than to each other.  The matching
+        is found by _maximum_matching, in polynomial time whatever the
+        league size, season length or number of byes.
+
+        Returns True if every team now has its byes, False (changing
+        nothing) if no such set of games exists.
+    """
+    index = schedule.team_index
+    short = {}
+    for abbrev, team in schedule.teams.items():
+        missing = byes - schedule.bye_counts[index[abbrev]]
+        if not team.is_pseudo_team_bye() and missing > 0:
+            short[abbrev] = missing
+    if not short:
+        return True
+
+    adjacent = []
+    nodes = {}
+    for abbrev, missing in short.items():
+        nodes[abbrev] = list(range(len(adjacent), len(adjacent) + missing))
+        adjacent.extend([] for _ in range(missing))
+    games = []
+    for g in schedule.games:
+        if g.forced or g.is_bye or g.home.abbrev not in short or g.away.abbrev not in short:
+            continue
+        h, a = len(adjacent), len(adjacent) + 1
+        adjacent.append([a] + nodes[g.home.abbrev])
+        adjacent.append([h] + nodes[g.away.abbrev])
+        for t in nodes[g.home.abbrev]:
+            adjacent[t].append(h)
+        for t in nodes[g.away.abbrev]:
+            adjacent[t].append(a)
+        games.append((g, h, a))
+
+    mate = _maximum_matching(adjacent)
+    if -1 in mate:
+        log.debug('Unable to add bye for %s', sorted(short))
+        return False
+    for g, h, a in games:
+        if mate[h] != a:
             g.is_bye = True
-            print('Changing game %s to bye' % g)
-            g = schedule.contains_matchup(needs_bye[1], needs_bye[2])
-            if g and not g.forced:
-                g.is_bye = True
-                print('Changing game %s to bye' % g)
-                return
-            else:
-                print('Unable to add bye for %s', needs_bye)
-                return
-    print('Unable to add bye for %s', needs_bye)
+            log.debug('Changing game %s to bye', g)
+    return True
@@ -0,0 +1,69 @@
+import json
+import os
+import tempfile
+import time
+
+
+# Bumped whenever the saved state changes shape
+checkpoint_version = 1
+
+
+class Checkpoint:
+    """ Where and how often (seconds) a solver run saves its state, so an
+        interrupted run can be resumed from the last save (see
+        make_schedule in schedule.py).
+    """
+
+    def __init__(self, path, interval=60.0):
+        self.path = path
+        self.interval = interval
+        self.last_save = time.perf_counter()
+
+    def due(self):
+        return time.perf_counter() - self.last_save >= self.interval
+
+    def save(self, state):
+        save_checkpoint(self.path, state)
+        self.last_save = time.perf_counter()
+
+
+def save_checkpoint(path, state):
+    """ Write the state as compact JSON, atomically: it goes to a
+        temporary file in the same directory which then replaces path,
+        so a crash mid-write leaves the previous checkpoint intact
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.checkpoint-', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(state, version=checkpoint_version), f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_checkpoint(path):
+    with open(path) as f:
+        state = json.load(f)
+    if state.get('version') != checkpoint_version:
+        raise ValueError('%s is not a version %s checkpoint' % (path, checkpoint_version))
+    return state
+
+
+def rng_state(rng):
+    """ The state of a random.Random as JSON-friendly lists """
+    version, internal, gauss = rng.getstate()
+    return [version, list(internal), gauss]
+
+
+def set_rng_state(rng, state):
+    version, internal, gauss = state
+    rng.setstate((version, tuple(internal), gauss))
+
+
+def encode_schedule(schedule):
+    """ The games of a schedule as [home, away, week, forced, bye] lists """
+    return [[g.home.abbrev, g.away.abbrev, g.week, bool(g.forced), g.is_bye] for g in schedule.games]
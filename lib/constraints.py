@@ -0,0 +1,195 @@
+from lib.errors import SharedFieldError, CrossDivisionError, RequiredMatchupError, BlackoutError, NeverHomeError
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+class Constraints:
+    """ League rules compiled once into index tables so the generator
+        and rebalancer can check them without string comparisons.
+
+        Teams are numbered in the order of the teams dict (the same
+        order LeagueSchedule indexes them in), and sets of teams are
+        bitmasks: team i is bit 1 << i.
+
+        shared_fields is a list of groups of teams sharing a home field
+        (no two of a group may be home in the same week); field_capacity
+        is a list of (clubs, capacity) pairs: the teams of those clubs,
+        in every division, may be home at most capacity times a week.
+        max_cross_division_games caps each team's games against other
+        divisions (None: no cap); crossover_quotas maps a pair of
+        divisions to the most games each team may play against the
+        other division (None: any divisions may meet, otherwise pairs
+        not listed never meet); required_matchups is a list of pairs
+        that must meet in some week; blackout_weeks maps a team to the
+        weeks it cannot play (it takes its bye then).  Pseudo bye teams,
+        never-home teams and clubs come from the Team flags.
+    """
+
+    def __init__(self, teams, number_weeks, shared_fields=(), max_cross_division_games=None,
+                 required_matchups=(), blackout_weeks=None, crossover_quotas=None, field_capacity=()):
+        self.teams = list(teams)
+        self.index = dict((abbrev, i) for i, abbrev in enumerate(self.teams))
+        self.number_weeks = number_weeks
+        n = len(self.teams)
+
+        self.bye_teams = [t for t in self.teams if teams[t].is_pseudo_team_bye()]
+        self.bye_mask = self.mask(self.bye_teams)
+        self.real_mask = ((1 << n) - 1) & ~self.bye_mask
+        self.never_home_mask = self.mask(t for t in self.teams if teams[t].never_home)
+
+        # Each field is a (teams mask, home games per week) pair; a
+        # shared field takes one home game a week
+        self.shared_fields = [tuple(group) for group in shared_fields]
+        self.shared_field_masks = [self.mask(group) for group in self.shared_fields]
+        self.fields = [(group_mask, 1) for group_mask in self.shared_field_masks]
+        clubs = set(teams[t].club for t in self.teams)
+        for field_clubs, capacity in field_capacity:
+            for club in field_clubs:
+                if club not in clubs:
+                    raise ValueError('Unknown club %s in field capacity' % club)
+            self.fields.append((self.mask(t for t in self.teams if teams[t].club in field_clubs), capacity))
+        self.fields_of = [[f for f in self.fields if f[0] >> i & 1] for i in range(n)]
+        self.field_partners = [0] * n
+        for i in range(n):
+            for group_mask, capacity in self.fields_of[i]:
+                self.field_partners[i] |= group_mask & ~(1 << i)
+
+        # Divisions are numbered in sorted order; pseudo bye teams have none
+        self.divisions = sorted(set(teams[t].division for t in self.teams if self.real_mask >> self.index[t] & 1))
+        self.division_of = [self.divisions.index(teams[t].division) if self.real_mask >> i & 1 else -1
+                            for i, t in enumerate(self.teams)]
+        self.division_masks = [self.mask(t for i, t in enumerate(self.teams) if self.division_of[i] == d)
+                               for d in range(len(self.divisions))]
+        self.cross_division = [0] * n
+        for i in range(n):
+            if self.division_of[i] >= 0:
+                self.cross_division[i] = self.real_mask & ~self.division_masks[self.division_of[i]]
+
+        self.max_cross_division_games = max_cross_division_games
+        self.crossover_quotas = crossover_quotas
+        self.crossover_limit = [[None] * len(self.divisions) for _ in self.divisions]
+        if crossover_quotas is not None:
+            for d1 in range(len(self.divisions)):
+                for d2 in range(len(self.divisions)):
+                    if d1 != d2:
+                        self.crossover_limit[d1][d2] = 0
+            for pair, limit in crossover_quotas.items():
+                a, b = pair
+                if a not in self.divisions or b not in self.divisions or a == b:
+                    raise ValueError('Crossover quota %s vs %s needs two divisions of the league' % (a, b))
+                d1, d2 = self.divisions.index(a), self.divisions.index(b)
+                self.crossover_limit[d1][d2] = self.crossover_limit[d2][d1] = limit
+        self.limits_crossovers = max_cross_division_games is not None or crossover_quotas is not None
+
+        self.required_pairs = []
+        for a, b in required_matchups:
+            if a == b:
+                raise ValueError('Required matchup %s vs %s is the same team' % (a, b))
+            self.required_pairs.append((self.index_of(a), self.index_of(b)))
+
+        self.blackout = [0] * number_weeks
+        for team, weeks in (blackout_weeks or {}).items():
+            i = self.index_of(team)
+            for week in weeks:
+                if not 1 <= week <= number_weeks:
+                    raise ValueError('Blackout week %s for %s is not in the season' % (week, team))
+                self.blackout[week - 1] |= 1 << i
+
+    def index_of(self, abbrev):
+        try:
+            return self.index[abbrev]
+        except KeyError:
+            raise ValueError('Unknown team %s in constraints' % abbrev)
+
+    def mask(self, abbrevs):
+        mask = 0
+        for abbrev in abbrevs:
+            mask |= 1 << self.index_of(abbrev)
+        return mask
+
+    def abbrevs(self, mask):
+        return set(t for i, t in enumerate(self.teams) if mask >> i & 1)
+
+    def field_taken(self, schedule, i, week):
+        """ True if a field team i plays home games on is full in week """
+        home = schedule.home_by_week[week - 1] & ~(1 << i)
+        for group_mask, capacity in self.fields_of[i]:
+            if _popcount(home & group_mask) >= capacity:
+                return True
+        return False
+
+    def shared_field_weeks(self, schedule, group_mask, capacity=1):
+        """ Weeks in which more teams of the group are home than its
+            field can host
+        """
+        return [w + 1 for w, home in enumerate(schedule.home_by_week) if _popcount(home & group_mask) > capacity]
+
+    def cross_division_games(self, schedule, i):
+        """ Games team i has played against other divisions """
+        counts = schedule.division_counts[i]
+        return sum(counts) - counts[self.division_of[i]]
+
+    def cross_division_full(self, schedule, i):
+        """ True if team i may play no more games against other divisions """
+        limit = self.max_cross_division_games
+        return limit is not None and self.cross_division_games(schedule, i) >= limit
+
+    def crossover_full(self, schedule, i, d):
+        """ True if team i may play no more games against division d """
+        limit = self.crossover_limit[self.division_of[i]][d]
+        return limit is not None and schedule.division_counts[i][d] >= limit
+
+    def cross_division_avoid(self, schedule, i):
+        """ Teams team i may not meet because one of the two has no
+            games left against the other's division
+        """
+        if not self.limits_crossovers:
+            return 0
+        if self.cross_division_full(schedule, i):
+            return self.cross_division[i]
+        own = self.division_of[i]
+        mask = 0
+        for d in range(len(self.divisions)):
+            if d != own and self.crossover_full(schedule, i, d):
+                mask |= self.division_masks[d]
+        for j in range(len(self.teams)):
+            if (self.cross_division[i] & ~mask) >> j & 1:
+                if self.cross_division_full(schedule, j) or self.crossover_full(schedule, j, own):
+                    mask |= 1 << j
+        return mask
+
+    def check_required_matchups(self, schedule):
+        for i, j in self.required_pairs:
+            if not schedule.played[i] >> j & 1:
+                raise RequiredMatchupError('%s and %s must play' % (self.teams[i], self.teams[j]))
+
+    def check(self, schedule):
+        """ Raise the IterationError for the first rule the schedule breaks """
+        for w, home in enumerate(schedule.home_by_week):
+            if home & self.never_home_mask:
+                raise NeverHomeError('%s cannot be home in week %s' % (
+                    '/'.join(sorted(self.abbrevs(home & self.never_home_mask))), w + 1), week=w + 1)
+        for group_mask, capacity in self.fields:
+            weeks = self.shared_field_weeks(schedule, group_mask, capacity)
+            if weeks:
+                raise SharedFieldError('More than %s of %s home in week %s' % (
+                    capacity, '/'.join(sorted(self.abbrevs(group_mask))), weeks[0]), week=weeks[0])
+        self.check_required_matchups(schedule)
+        for w, mask in enumerate(self.blackout):
+            for i, games in enumerate(schedule.game_matrix):
+                g = games[w]
+                if mask >> i & 1 and g is not None and not g.is_bye:
+                    raise BlackoutError('%s cannot play in week %s' % (self.teams[i], w + 1), week=w + 1)
+        if self.limits_crossovers:
+            for i, own in enumerate(self.division_of):
+                if own < 0:
+                    continue
+                cross = self.cross_division_games(schedule, i)
+                if self.max_cross_division_games is not None and cross > self.max_cross_division_games:
+                    raise CrossDivisionError('%s plays %s cross-division games' % (self.teams[i], cross))
+                for d, limit in enumerate(self.crossover_limit[own]):
+                    if limit is not None and schedule.division_counts[i][d] > limit:
+                        raise CrossDivisionError('%s plays %s games against division %s' % (
+                            self.teams[i], schedule.division_counts[i][d], self.divisions[d]))
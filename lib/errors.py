@@ -1,9 +1,39 @@
 
 class IterationError(Exception):
-    pass
+    """ A candidate schedule had to be thrown away.  reason names the
+        failure for telemetry; week is the week it happened in, if known.
+    """
+    reason = 'iteration_error'
+
+    def __init__(self, message='', week=None):
+        super().__init__(message)
+        self.week = week
 
 class CannotFulfillOverride(IterationError):
-    pass
+    reason = 'cannot_fulfill_override'
 
 class NoAvailableOpponnentError(IterationError):
-    pass
\ No newline at end of file
+    reason = 'no_available_opponent'
+
+class SharedFieldError(IterationError):
+    reason = 'shared_field'
+
+class RequiredMatchupError(IterationError):
+    reason = 'required_matchup'
+
+class CrossDivisionError(IterationError):
+    reason = 'cross_division'
+
+class BlackoutError(IterationError):
+    reason = 'blackout'
+
+class NeverHomeError(IterationError):
+    reason = 'never_home'
+
+class NoOrientationError(IterationError):
+    reason = 'no_orientation'
+
+class RepairError(Exception):
+    """ No repair of a schedule keeps its frozen weeks and meets the
+        overrides (or none was found in time)
+    """
@@ -0,0 +1,597 @@
+import math
+import random
+
+from lib.backtrack import WeekFiller
+from lib.errors import NoAvailableOpponnentError
+
+try:
+    from ortools.sat.python import cp_model
+except ImportError:  # optional; the pure-Python search is used instead
+    cp_model = None
+
+
+def _popcount(mask):
+    return bin(mask).count('1')
+
+
+class ExactResult:
+    """ Outcome of an exact solve.
+
+        status is 'feasible' (games holds (home, away, week, forced, is_bye)
+        tuples), 'infeasible' (proven; conflicts holds the overrides that
+        cannot all be satisfied together, empty if the league cannot be
+        scheduled even without overrides), 'unknown' (the time or node
+        limit ran out first) or 'unverified' (a schedule was found but
+        broke a league rule when checked, so nothing is proven; error
+        says which).
+
+        conflicts is minimal (dropping any one of them makes the rest
+        feasible) unless minimal is False: a search without one of them
+        ran out of time or nodes, so it was kept without proof.
+    """
+
+    def __init__(self, status, backend, games=None, conflicts=None, error=None, minimal=True):
+        self.status = status
+        self.backend = backend
+        self.games = games or []
+        self.conflicts = conflicts or []
+        self.error = error
+        self.minimal = minimal
+
+    def __repr__(self):
+        return "<ExactResult %s (%s)>" % (self.status, self.backend)
+
+
+class League:
+    """ The league rules shared by both exact backends, taken from the
+        compiled constraints (lib/constraints.py): pseudo bye teams,
+        never-home teams (no home games, and exempt from the home bounds
+        and streak limit), fields as (teams, capacity) pairs, required
+        matchups, blackout weeks and cross-division limits.
+    """
+
+    def __init__(self, constraints, require_bye, streak_limit):
+        self.constraints = constraints
+        self.teams = list(constraints.teams)
+        self.pseudo = set(constraints.bye_teams)
+        self.real = [t for t in self.teams if t not in self.pseudo]
+        self.never_home = constraints.abbrevs(constraints.never_home_mask)
+        self.homed = [t for t in self.real if t not in self.never_home]
+        self.number_weeks = constraints.number_weeks
+        self.require_bye = require_bye
+        self.streak_limit = streak_limit
+        self.fields = [(sorted(constraints.abbrevs(group_mask)), capacity)
+                       for group_mask, capacity in constraints.fields
+                       if _popcount(group_mask) > capacity]
+        self.required = [(self.teams[i], self.teams[j]) for i, j in constraints.required_pairs]
+        self.blackout = [constraints.abbrevs(mask) for mask in constraints.blackout]
+        self.home_bounds = (int(math.floor(self.number_weeks / 2.0)), int(math.ceil(self.number_weeks / 2.0)))
+
+    def cross_limits(self, t):
+        """ (teams, most games) caps on t's games against other divisions """
+        constraints = self.constraints
+        i = constraints.index[t]
+        own = constraints.division_of[i]
+        limits = []
+        if constraints.max_cross_division_games is not None:
+            limits.append((constraints.cross_division[i], constraints.max_cross_division_games))
+        for d, limit in enumerate(constraints.crossover_limit[own]):
+            if d != own and limit is not None:
+                limits.append((constraints.division_masks[d], limit))
+        return [(sorted(constraints.abbrevs(mask)), limit) for mask, limit in limits]
+
+
+def _forced_games(override_index, pairs):
+    """ Attach the forced/is_bye flags of the forced games to solved pairs """
+    games = []
+    for home, away, week in pairs:
+        forced = [g for g in (override_index.forced_of.get((home, week)), override_index.forced_of.get((away, week)))
+                  if g is not None]
+        games.append((home, away, week, bool(forced), any(g.is_bye for g in forced)))
+    return games
+
+
+def _cpsat_model(league, override_index):
+    """ The CP-SAT model of the league, with one literal per override
+        (override_index holds all of them) that enforces it when true.
+        Returns (model, x, bye, literals): x[h, a, w] is true when h is
+        home against a in week w, bye[t, w] when real team t has a bye.
+    """
+    model = cp_model.CpModel()
+    teams = league.teams
+    weeks = range(1, league.number_weeks + 1)
+
+    # x[h, a, w]: h is home against a in week w.  A bye is always stored
+    # with the real team as "home" since home/away doesn't matter for it.
+    x = {}
+    for w in weeks:
+        for h in teams:
+            for a in teams:
+                if h != a and not (h in league.pseudo and a not in league.pseudo):
+                    x[h, a, w] = model.NewBoolVar('%s_%s_%s' % (h, a, w))
+
+    def meeting(a, b, w):
+        return [v for v in (x.get((a, b, w)), x.get((b, a, w))) if v is not None]
+
+    forced_pseudo_pairs = set()
+    for games in override_index.by_week:
+        for g in games:
+            if g.opponent is not None:
+                forced_pseudo_pairs.add((frozenset((g.team.abbrev, g.opponent.abbrev)), g.week))
+
+    home, away, bye = {}, {}, {}
+    for w in weeks:
+        for t in teams:
+            games = [v for (h, a, ww), v in x.items() if ww == w and t in (h, a)]
+            if t in league.real:
+                model.Add(sum(games) == 1)
+            else:
+                model.Add(sum(games) <= 1)
+        for t in league.real:
+            home[t, w] = sum(x[t, a, w] for a in league.real if a != t)
+            away[t, w] = sum(x[h, t, w] for h in league.real if h != t)
+            bye[t, w] = sum(x[t, p, w] for p in teams if p in league.pseudo)
+        # pseudo teams only meet each other when an override says so
+        for p in teams:
+            for q in teams:
+                if p < q and p in league.pseudo and q in league.pseudo and (frozenset((p, q)), w) not in forced_pseudo_pairs:
+                    for v in meeting(p, q, w):
+                        model.Add(v == 0)
+
+    for i, a in enumerate(teams):
+        for b in teams[i + 1:]:
+            model.Add(sum(v for w in weeks for v in meeting(a, b, w)) <= 1)
+
+    for t in league.real:
+        if league.require_bye:
+            model.Add(sum(bye[t, w] for w in weeks) == 1)
+        for w in weeks:
+            if t in league.blackout[w - 1]:
+                model.Add(bye[t, w] == 1)
+        for opponents, limit in league.cross_limits(t):
+            model.Add(sum(v for a in opponents for w in weeks for v in meeting(t, a, w)) <= limit)
+    for t in league.never_home:
+        for w in weeks:
+            model.Add(home[t, w] == 0)
+    for a, b in league.required:
+        model.Add(sum(v for w in weeks for v in meeting(a, b, w)) == 1)
+
+    lo, hi = league.home_bounds
+    limit = league.streak_limit
+    for t in league.homed:
+        model.Add(sum(home[t, w] for w in weeks) >= lo)
+        model.Add(sum(home[t, w] for w in weeks) <= hi)
+        if limit:
+            # byes don't break a streak: a window of limit + 1 + k weeks
+            # holding j <= k byes must not be all home (or all away) games,
+            # i.e. home + min(j, k) <= limit + k
+            for k in range(league.number_weeks - limit):
+                size = limit + 1 + k
+                for start in range(1, league.number_weeks - size + 2):
+                    window = range(start, start + size)
+                    byes = sum(bye[t, w] for w in window)
+                    if k > 0 and not league.require_bye:
+                        capped = model.NewIntVar(0, k, 'byes_%s_%s_%s' % (t, start, k))
+                        model.AddMinEquality(capped, [byes, k])
+                        byes = capped
+                    elif k == 0:
+                        byes = 0
+                    model.Add(sum(home[t, w] for w in window) + byes <= limit + k)
+                    model.Add(sum(away[t, w] for w in window) + byes <= limit + k)
+
+    for group, capacity in league.fields:
+        for w in weeks:
+            model.Add(sum(home[t, w] for t in group if t in league.real) <= capacity)
+
+    literals = [model.NewBoolVar('override_%s' % i) for i in range(len(override_index.overrides))]
+    for avoided in override_index.avoids:
+        lit = literals[avoided.position]
+        for w in ([avoided.week] if avoided.week else weeks):
+            for v in meeting(avoided.team.abbrev, avoided.opponent.abbrev, w):
+                model.Add(v == 0).OnlyEnforceIf(lit)
+    for games in override_index.by_week:
+        for g in games:
+            lit, t, w = literals[g.position], g.team.abbrev, g.week
+            if g.opponent is not None:
+                pair = (t, g.opponent.abbrev) if g.home else (g.opponent.abbrev, t)
+                if pair + (w,) not in x:
+                    pair = (pair[1], pair[0])  # a bye, stored real team first
+                model.Add(x[pair + (w,)] == 1).OnlyEnforceIf(lit)
+            elif g.home:
+                model.Add(sum(x[h, t, w] for h in teams if (h, t, w) in x) == 0).OnlyEnforceIf(lit)
+            else:
+                model.Add(sum(x[t, a, w] for a in league.real if (t, a, w) in x) == 0).OnlyEnforceIf(lit)
+    return model, x, bye, literals
+
+
+def _cpsat_solve(league, override_index, assumed, time_limit):
+    """ Solve with CP-SAT, treating only the overrides at the indexes in
+        assumed as hard (override_index holds all of them).  Returns (status, pairs, core indexes).
+    """
+    model, x, bye, literals = _cpsat_model(league, override_index)
+    model.AddAssumptions([literals[i] for i in assumed])
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    solver.parameters.num_workers = 1  # needed for infeasibility cores
+    status = solver.Solve(model)
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        pairs = [(h, a, w) for (h, a, w), v in x.items() if solver.Value(v)]
+        return 'feasible', sorted(pairs, key=lambda p: p[2]), None
+    if status == cp_model.INFEASIBLE:
+        position = dict((lit.Index(), i) for i, lit in enumerate(literals))
+        core = [position[i] for i in solver.SufficientAssumptionsForInfeasibility()]
+        return 'infeasible', None, sorted(core)
+    return 'unknown', None, None
+
+
+class _OrientingFiller(WeekFiller):
+    """ WeekFiller that also decides home/away while it searches, pruning
+        on home counts, the consecutive home/away limit, forced venues,
+        never-home teams and fields, and on the pairing rules: blackout
+        weeks, cross-division limits and required matchups.  Without a
+        node limit it is a complete search.
+    """
+
+    def __init__(self, league, override_index, rng, max_nodes):
+        WeekFiller.__init__(self, league.teams, league.number_weeks, override_index, rng,
+                            league.require_bye, max_nodes, bye_teams=league.pseudo,
+                            constraints=league.constraints)
+        n = len(self.abbrevs)
+        self.league = league
+        self.home = [0] * n
+        self.away = [0] * n
+        self.run = [0] * n  # > 0: consecutive home games, < 0: away
+        self.never_home_mask = self.mask(league.never_home)
+        self.fields_of = [[] for _ in range(n)]
+        for group, capacity in league.fields:
+            field = (self.mask(group), capacity)
+            for t in group:
+                self.fields_of[self.index[t]].append(field)
+        self.week_home = [0] * league.number_weeks
+        self.forced_venue = {}
+        for w, games in enumerate(override_index.by_week):
+            for g in games:
+                t = self.index[g.team.abbrev]
+                if g.opponent is not None:
+                    # a forced matchup is home for the team only with force_home
+                    a = self.index[g.opponent.abbrev]
+                    home, away = (t, a) if g.home else (a, t)
+                    self.forced_venue[(home, w)] = 'home'
+                    self.forced_venue[(away, w)] = 'away'
+                else:
+                    self.forced_venue[(t, w)] = 'home' if g.home else 'away'
+        lo, hi = league.home_bounds
+        games = league.number_weeks - (1 if league.require_bye else 0)
+        self.max_home = hi
+        self.max_away = games - lo
+        self.min_away = games - hi if league.require_bye else 0
+        forced = [g for games in override_index.by_week for g in games]
+        self.venues = dict((self.index[t], _team_venues(league, t, forced)[0]) for t in league.real)
+
+    def _snapshot(self):
+        return (self.bye_mask, list(self.home), list(self.away), list(self.run), list(self.week_home))
+
+    def _place(self, w, home, away):
+        WeekFiller._place(self, w, home, away)
+        if self.pseudo_mask >> home & 1 or self.pseudo_mask >> away & 1:
+            return
+        self.home[home] += 1
+        self.away[away] += 1
+        self.run[home] = self.run[home] + 1 if self.run[home] > 0 else 1
+        self.run[away] = self.run[away] - 1 if self.run[away] < 0 else -1
+        self.week_home[w] |= 1 << home
+
+    def _restore(self, home, away, snapshot):
+        WeekFiller._restore(self, home, away, snapshot[0])
+        self.home, self.away, self.run, self.week_home = snapshot[1:]
+
+    def _ok(self, w, home, away):
+        if self.forced_venue.get((home, w)) == 'away' or self.forced_venue.get((away, w)) == 'home':
+            return False
+        if self.never_home_mask >> home & 1:
+            return False
+        if self.home[home] + 1 > self.max_home:
+            return False
+        limit = self.league.streak_limit
+        if limit and self.run[home] >= limit:
+            return False
+        if not self.never_home_mask >> away & 1:
+            if self.away[away] + 1 > self.max_away or (limit and self.run[away] <= -limit):
+                return False
+        for group_mask, capacity in self.fields_of[home]:
+            if _popcount(self.week_home[w] & group_mask) >= capacity:
+                return False
+        return True
+
+    def _orientations(self, w, a, b):
+        if self.pseudo_mask >> a & 1 or self.pseudo_mask >> b & 1:
+            return [(a, b)]
+        if self._excluded(w, a) >> b & 1:
+            return []
+        options = [(a, b), (b, a)]
+        self.rng.shuffle(options)
+        # try first whichever way evens out both teams' home/away counts
+        options.sort(key=lambda o: self.home[o[0]] - self.away[o[0]] + self.away[o[1]] - self.home[o[1]])
+        return [(h, aw) for h, aw in options if self._ok(w, h, aw)]
+
+    def _week_done(self, w):
+        if not WeekFiller._week_done(self, w):
+            return False
+        lo, hi = self.league.home_bounds
+        weeks_left = self.number_weeks - w - 1
+        for t in _real_indexes(self):
+            if self.never_home_mask >> t & 1:
+                continue
+            if self.home[t] + weeks_left < lo or self.away[t] + weeks_left < self.min_away:
+                return False
+        # each team's forced venues must still fit its bounds and streak limit
+        for t, venues in self.venues.items():
+            run = self.run[t]
+            start = (self.home[t], self.bye_mask >> t & 1, 'H' if run > 0 else 'A' if run < 0 else None, abs(run))
+            if not _home_counts(self.league, self.abbrevs[t], venues[w + 1:], start):
+                return False
+        return True
+
+
+def _real_indexes(filler):
+    return [i for i, t in enumerate(filler.abbrevs) if filler.real_mask >> i & 1]
+
+
+def _relaxation_conflict(league, override_index, assumed, rng):
+    """ Cheap necessary conditions checked before the full search.  Each
+        looks at a small part of the problem (one week, one team, one
+        matchup), so if it fails the whole league is infeasible and the
+        overrides involved are the conflict.  Returns those indexes or None.
+    """
+    active = override_index.subset(assumed)
+    forced = [g for games in active.by_week for g in games]
+
+    # the same matchup forced twice, or forced and avoided
+    forced_weeks = {}
+    avoided = {}
+    for g in forced:
+        if g.opponent is not None:
+            forced_weeks.setdefault(frozenset((g.team.abbrev, g.opponent.abbrev)), []).append(g)
+    for a in active.avoids:
+        if a.week is None:
+            avoided.setdefault(frozenset((a.team.abbrev, a.opponent.abbrev)), []).append(a.position)
+    for pair, games in forced_weeks.items():
+        if len(set(g.week for g in games)) > 1:
+            return [g.position for g in games]
+        if pair in avoided:
+            return [games[0].position] + avoided[pair][:1]
+    # a required matchup that is avoided
+    for a, b in league.required:
+        if frozenset((a, b)) in avoided:
+            return avoided[frozenset((a, b))][:1]
+
+    # each week on its own (plus season-long avoids)
+    for week in range(1, league.number_weeks + 1):
+        if not active.by_week[week - 1] and not any(a.week == week for a in active.avoids):
+            continue
+        one_week = active.week_only(week)
+        filler = WeekFiller(league.teams, 1, one_week, rng, False, 100000, bye_teams=league.pseudo)
+        try:
+            if not filler.fill_week(0):
+                return sorted(set(one_week.positions))
+        except NoAvailableOpponnentError:
+            pass
+
+    # each team's forced venues, byes and blackout weeks against its
+    # home bounds and the streak limit
+    counts = {}
+    for t in league.real:
+        allowed, positions = _team_venues(league, t, forced)
+        counts[t] = _home_counts(league, t, allowed)
+        if positions and not counts[t]:
+            return sorted(positions)
+
+    # with one bye each, the real teams play a fixed number of games, and
+    # each has one home team: the fewest (or most) home games the teams
+    # can have must not overshoot (or fall short of) it
+    if league.require_bye:
+        games = len(league.real) * (league.number_weeks - 1) // 2
+        lo, hi = league.home_bounds
+        fewest = dict((t, min(counts[t])) for t in league.real if counts[t])
+        most = dict((t, max(counts[t])) for t in league.real if counts[t])
+        if sum(fewest.values()) > games:
+            raised = [t for t in fewest if t not in league.never_home and fewest[t] > lo]
+            return sorted(p for t in raised for p in _team_venues(league, t, forced)[1])
+        if sum(most.values()) < games:
+            lowered = [t for t in most if t not in league.never_home and most[t] < hi]
+            return sorted(p for t in lowered for p in _team_venues(league, t, forced)[1])
+    return None
+
+
+def _team_venues(league, t, forced):
+    """ What real team t can be in each week given the forced games:
+        home (H), away (A) and/or on a bye (B), as a string per week, and
+        the positions of the overrides that narrowed it down
+    """
+    allowed = ['B' if t in league.blackout[w] else 'HAB' for w in range(league.number_weeks)]
+    positions = []
+    for g in forced:
+        if g.opponent is None:
+            if g.team.abbrev != t:
+                continue
+            # a forced venue without a named opponent may still be met by the bye
+            venues = 'HB' if g.home else 'AB'
+        elif t not in (g.team.abbrev, g.opponent.abbrev):
+            continue
+        elif g.team.abbrev in league.pseudo or g.opponent.abbrev in league.pseudo:
+            venues = 'B'
+        else:
+            venues = 'H' if g.home_team().abbrev == t else 'A'
+        allowed[g.week - 1] = ''.join(v for v in allowed[g.week - 1] if v in venues)
+        positions.append(g.position)
+    return allowed, positions
+
+
+def _home_counts(league, t, allowed, start=(0, 0, None, 0)):
+    """ The numbers of home games team t can end up with when it is home
+        (H), away (A) or on a bye (B) in each week as allowed[w]
+        permits, within the home bounds, the streak limit (byes don't
+        break a streak) and, if required, one bye; empty if there is no
+        way.  A never-home team is exempt from the bounds and the limit.
+        start is where the weeks before allowed left t: (home games,
+        byes, venue of its last game, games in a row there).
+    """
+    homed = t not in league.never_home
+    lo, hi = league.home_bounds
+    limit = league.streak_limit if homed else None
+    states = set([start])
+    for venues in allowed:
+        reached = set()
+        for home, byes, last, run in states:
+            for v in venues:
+                if v == 'B':
+                    if not (league.require_bye and byes):
+                        reached.add((home, 1, last, run))
+                    continue
+                if v == 'H' and not homed:
+                    continue
+                run_now = run + 1 if v == last else 1
+                home_now = home + (v == 'H')
+                if (limit and run_now > limit) or (homed and home_now > hi):
+                    continue
+                reached.add((home_now, byes, v, run_now))
+        states = reached
+    return set(home for home, byes, last, run in states
+               if (byes or not league.require_bye) and (home >= lo or not homed))
+
+
+def _python_solve(league, override_index, assumed, max_nodes, rng):
+    """ Solve with the pure-Python search.  Returns (status, pairs, core
+        indexes).  Randomized restarts with a growing node budget find
+        schedules quickly; the final run gets the rest of max_nodes and
+        is complete, so running out of it means 'unknown', while
+        finishing without a schedule proves infeasibility (the core is
+        then all of assumed, since the search can't tell which overrides
+        it depended on).
+    """
+    core = _relaxation_conflict(league, override_index, assumed, rng)
+    if core is not None:
+        return 'infeasible', None, core
+
+    active = override_index.subset(assumed)
+    budget = 1000
+    spent = 0
+    while True:
+        final = spent + 2 * budget > max_nodes
+        filler = _OrientingFiller(league, active, rng, max_nodes - spent if final else budget)
+        try:
+            found = filler.fill_week(0)
+            break
+        except NoAvailableOpponnentError:
+            if final:
+                return 'unknown', None, None
+            spent += budget
+            budget *= 2
+    if not found:
+        return 'infeasible', None, list(assumed)
+    pairs = []
+    for w, week_pairs in enumerate(filler.weeks):
+        for h, a in week_pairs:
+            pairs.append((filler.abbrevs[h], filler.abbrevs[a], w + 1))
+    return 'feasible', pairs, None
+
+
+def solve_exact(constraints, override_index, require_bye, streak_limit, backend='auto', time_limit=60,
+                max_nodes=2000000, seed=0):
+    """ Exactly solve the league: find a schedule meeting every rule
+        (one game per team per week, no repeated matchups, byes, home
+        counts, streak limit, all overrides, and the rules compiled in
+        constraints: never-home teams, shared fields and field capacity,
+        required matchups, blackout weeks and cross-division limits) or
+        prove none exists.  The overrides are read from override_index
+        (lib/overrides.py).
+
+        backend is 'cpsat' (needs the optional ortools package), 'python'
+        (a complete backtracking search; fine for conflicts that show up
+        early but may hit max_nodes on others) or 'auto' (CP-SAT when
+        installed).  When infeasible, the conflicting overrides are
+        narrowed down to a minimal set by dropping them one at a time and
+        solving again (with either backend); the cheap checks of the
+        Python backend usually settle each of these at once.
+    """
+    if backend == 'auto':
+        backend = 'cpsat' if cp_model is not None else 'python'
+    if backend == 'cpsat' and cp_model is None:
+        raise ImportError('The cpsat backend needs ortools (pip install ortools)')
+
+    overrides = override_index.overrides
+    league = League(constraints, require_bye, streak_limit)
+    rng = random.Random(seed)
+
+    def solve(assumed):
+        if backend == 'cpsat':
+            return _cpsat_solve(league, override_index, assumed, time_limit)
+        return _python_solve(league, override_index, assumed, max_nodes, rng)
+
+    status, pairs, core = solve(list(range(len(overrides))))
+    if status == 'feasible':
+        return ExactResult(status, backend, games=_forced_games(override_index, pairs))
+    if status == 'unknown':
+        return ExactResult(status, backend)
+
+    # deletion filter: drop each override in turn, keep it if the rest
+    # is feasible (or, if the search ran out first, may be)
+    minimal = True
+    for i in list(core):
+        rest = [j for j in core if j != i]
+        status = solve(rest)[0]
+        if status == 'infeasible':
+            core = rest
+        elif status == 'unknown':
+            minimal = False
+    return ExactResult('infeasible', backend, conflicts=[overrides[i] for i in core], minimal=minimal)
+
+
+def repair_exact(constraints, override_index, require_bye, streak_limit, original, frozen_weeks, time_limit=60):
+    """ Re-solve a schedule with CP-SAT after an override changed,
+        changing as few of its games as possible.  original holds the
+        schedule's (home, away, week, is_bye) games; the games of weeks
+        up to frozen_weeks are kept as they are (their byes against any
+        pseudo team), so only the overrides of later weeks (and those of
+        no week) are enforced.  Every other game kept, with the same
+        home team (or as a bye), counts one towards the objective.
+
+        Returns an ExactResult: 'feasible' with the games of the best
+        schedule found in time_limit seconds, 'infeasible' when no
+        schedule keeps the frozen weeks, or 'unknown'.
+    """
+    if cp_model is None:
+        raise ImportError('Repairing exactly needs ortools (pip install ortools)')
+    league = League(constraints, require_bye, streak_limit)
+    model, x, bye, literals = _cpsat_model(league, override_index)
+    played = set(g.position for games in override_index.by_week[:frozen_weeks] for g in games)
+    played.update(a.position for a in override_index.avoids if a.week and a.week <= frozen_weeks)
+    for i, lit in enumerate(literals):
+        if i not in played:
+            model.Add(lit == 1)
+
+    kept = []
+    for home, away, week, is_bye in original:
+        if is_bye:
+            games = [bye[t, week] for t in (home, away) if t in league.real]
+        elif home in league.real and away in league.real:
+            games = [x[home, away, week]]
+        else:
+            continue
+        for v in games:
+            if week <= frozen_weeks:
+                model.Add(v == 1)
+            else:
+                kept.append(v)
+    model.Maximize(sum(kept))
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    status = solver.Solve(model)
+    if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        pairs = sorted(((h, a, w) for (h, a, w), v in x.items() if solver.Value(v)), key=lambda p: p[2])
+        return ExactResult('feasible', 'cpsat', games=_forced_games(override_index, pairs))
+    if status == cp_model.INFEASIBLE:
+        return ExactResult('infeasible', 'cpsat')
+    return ExactResult('unknown', 'cpsat')
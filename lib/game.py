@@ -5,25 +5,45 @@ class Game:
     """ Represents a game between two teams in a given week.  If
         the game was the result of a forced condition, the forced
         flag is set.  If the game is a bye, the is_bye flag is set.
+
+        Once added to a LeagueSchedule, the game keeps a reference to
+        it so swaps and bye changes keep the schedule's index in sync.
     """
 
     def __init__(self, home, away, week, forced=False, is_bye=False):
+        self.schedule = None
         self.home = home
         self.away = away
         self.week = week
         self.forced = forced
-        self.is_bye = is_bye or _is_bye(home, away)
+        self._is_bye = is_bye or _is_bye(home, away)
 
-        if self.home.abbrev == 'PRM':
+        if self.home.never_home:
             self.swap()
 
+    @property
+    def is_bye(self):
+        return self._is_bye
+
+    @is_bye.setter
+    def is_bye(self, value):
+        if self.schedule is not None:
+            self.schedule._unindex(self)
+        self._is_bye = value
+        if self.schedule is not None:
+            self.schedule._index(self)
+
     def swap(self):
         """ Swap home and away teams """
-        if self.away.abbrev == 'PRM':
+        if self.away.never_home:
             return
+        if self.schedule is not None:
+            self.schedule._unindex(self)
         tmp = self.away
         self.away = self.home
         self.home = tmp
+        if self.schedule is not None:
+            self.schedule._index(self)
 
     def __repr__(self):
         return "Week %s - %s vs %s " % (self.week, self.home, self.away)
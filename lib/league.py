@@ -0,0 +1,70 @@
+from lib.constraints import Constraints
+from lib.overrides import OverrideIndex
+
+
+# Settings a LeagueConfig takes, with their defaults (see config.py)
+league_settings = dict(
+    number_weeks=9,
+    overrides=(),
+    require_bye=True,
+    max_consecutive_home_away_game_limit=3,
+    shared_fields=(),
+    max_cross_division_games=None,
+    crossover_quotas=None,
+    field_capacity=(),
+    required_matchups=(),
+    blackout_weeks=None,
+    generator='random',
+    local_search=None,
+    rebalancer='flow',
+    max_outer_loop_iterations=15000000,
+    max_rebalance_home_away_iterations=None,
+    max_local_search_steps=20000,
+    max_orient_repair_steps=200,
+    progress_interval=None,
+    exact_backend='auto',
+    exact_time_limit=60,
+    debug=False,
+)
+
+
+class LeagueConfig:
+    """ Everything about one league a Solver needs: the teams, season
+        length, overrides and rules (see config.py for what each setting
+        means), and the solver settings.  Overrides are parsed and
+        checked once into override_index (lib/overrides.py) and the
+        league rules compiled once into constraints (lib/constraints.py),
+        so a malformed or conflicting setting raises ValueError here.
+
+        Nothing is shared between two LeagueConfigs, so one process can
+        solve any number of leagues side by side.
+    """
+
+    def __init__(self, teams, **settings):
+        unknown = set(settings) - set(league_settings)
+        if unknown:
+            raise ValueError('Unknown league settings %s' % ', '.join(sorted(unknown)))
+        self.teams = teams
+        for name, default in league_settings.items():
+            setattr(self, name, settings.get(name, default))
+        self.overrides = [o for o in self.overrides if o is not None]
+        if self.max_rebalance_home_away_iterations is None:
+            self.max_rebalance_home_away_iterations = (len(teams) * self.number_weeks) ** 2
+
+        self.override_index = OverrideIndex(teams, self.number_weeks, self.overrides)
+        self.constraints = Constraints(teams, self.number_weeks, shared_fields=self.shared_fields,
+                                       max_cross_division_games=self.max_cross_division_games,
+                                       required_matchups=self.required_matchups,
+                                       blackout_weeks=self.blackout_weeks,
+                                       crossover_quotas=self.crossover_quotas,
+                                       field_capacity=self.field_capacity)
+
+    @classmethod
+    def from_module(cls, module, **changes):
+        """ The league set up in a settings module like config.py, with
+            any setting replaced by a keyword argument
+        """
+        teams = changes.pop('teams', module.teams)
+        settings = dict((name, getattr(module, name)) for name in league_settings if hasattr(module, name))
+        settings.update(changes)
+        return cls(teams, **settings)
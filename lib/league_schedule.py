@@ -0,0 +1,231 @@
+import logging
+
+from lib.byes import is_bye
+from lib.picker import Counter
+from lib.printer import print_schedule
+
+log = logging.getLogger(__name__)
+
+
+class LeagueSchedule:
+    """ Used to build a schedule for the entire league for a given
+        division and season.
+
+        Besides the list of games, the schedule keeps an array-backed
+        index (team index x week) of opponents and home/away flags, a
+        bitset of opponents already played per team, a bitset of the
+        teams home in each week, running home and bye counters, and the
+        games each team has played against each division (numbered as
+        in the compiled constraints) so the hot queries never scan game
+        lists.
+
+        The schedule belongs to a league (see lib/league.py), whose
+        rules it is checked against; picks of random opponents for it
+        are counted in pick_counter.
+    """
+
+    def __init__(self, league, pick_counter=None):
+        self.league = league
+        self.teams = league.teams.copy()
+        self.games = []
+        self.num_weeks = num_weeks = league.number_weeks
+        self.pick_counter = pick_counter if pick_counter is not None else Counter()
+        self.games_by_team = {}
+        for abbrev in self.teams:
+            self.games_by_team[abbrev] = []
+
+        self.team_index = dict((abbrev, i) for i, abbrev in enumerate(self.teams))
+        self.team_list = list(self.teams.values())
+        num_teams = len(self.teams)
+        self.game_matrix = [[None] * num_weeks for _ in range(num_teams)]
+        self.opponent_matrix = [[-1] * num_weeks for _ in range(num_teams)]
+        self.home_matrix = [[False] * num_weeks for _ in range(num_teams)]
+        self.played = [0] * num_teams
+        self.home_by_week = [0] * num_weeks
+        self.home_counts = [0] * num_teams
+        self.bye_counts = [0] * num_teams
+        self.bye_mask = league.constraints.bye_mask
+        self.division_of = league.constraints.division_of
+        self.division_counts = [[0] * len(league.constraints.divisions) for _ in range(num_teams)]
+
+    def print_schedule(self):
+        print_schedule(self)
+
+    def add(self, game):
+        if self.league.debug:
+            log.debug('Adding %s', game)
+        self.games.append(game)
+
+        # optimization
+        self.games_by_team[game.home.abbrev].append(game)
+        self.games_by_team[game.away.abbrev].append(game)
+
+        game.schedule = self
+        self._index(game)
+
+    def _index(self, game):
+        """ Record the game in the array-backed state """
+        h = self.team_index[game.home.abbrev]
+        a = self.team_index[game.away.abbrev]
+        w = game.week - 1
+        self.game_matrix[h][w] = game
+        self.game_matrix[a][w] = game
+        self.opponent_matrix[h][w] = a
+        self.opponent_matrix[a][w] = h
+        self.home_matrix[h][w] = True
+        self.home_matrix[a][w] = False
+        self.played[h] |= 1 << a
+        self.played[a] |= 1 << h
+        if game.is_bye:
+            self.bye_counts[h] += 1
+            self.bye_counts[a] += 1
+        else:
+            self.home_counts[h] += 1
+            self.home_by_week[w] |= 1 << h
+            self.division_counts[h][self.division_of[a]] += 1
+            self.division_counts[a][self.division_of[h]] += 1
+
+    def _unindex(self, game):
+        """ Remove the game from the array-backed state.  Called by the
+            game itself before it changes home/away or bye status.
+        """
+        h = self.team_index[game.home.abbrev]
+        a = self.team_index[game.away.abbrev]
+        w = game.week - 1
+        self.game_matrix[h][w] = None
+        self.game_matrix[a][w] = None
+        self.opponent_matrix[h][w] = -1
+        self.opponent_matrix[a][w] = -1
+        self.home_matrix[h][w] = False
+        self.played[h] &= ~(1 << a)
+        self.played[a] &= ~(1 << h)
+        if game.is_bye:
+            self.bye_counts[h] -= 1
+            self.bye_counts[a] -= 1
+        else:
+            self.home_counts[h] -= 1
+            self.home_by_week[w] &= ~(1 << h)
+            self.division_counts[h][self.division_of[a]] -= 1
+            self.division_counts[a][self.division_of[h]] -= 1
+
+    def swap_opponents(self, g1, g2, cross=False):
+        """ Exchange opponents between two games of the same week: swap
+            their away teams, or g1's away team with g2's home team if
+            cross.  Calling it again with the same arguments undoes it.
+        """
+        for g in (g1, g2):
+            self._unindex(g)
+            self.games_by_team[g.home.abbrev].remove(g)
+            self.games_by_team[g.away.abbrev].remove(g)
+        if cross:
+            g1.away, g2.home = g2.home, g1.away
+        else:
+            g1.away, g2.away = g2.away, g1.away
+        for g in (g1, g2):
+            g._is_bye = is_bye(g.home, g.away)
+            self.games_by_team[g.home.abbrev].append(g)
+            self.games_by_team[g.away.abbrev].append(g)
+            self._index(g)
+
+    def swap_weeks(self, week1, week2):
+        """ Move every game of week1 to week2 and vice versa """
+        games = [g for g in self.games if g.week in (week1, week2)]
+        for g in games:
+            self._unindex(g)
+        for g in games:
+            g.week = week2 if g.week == week1 else week1
+            self._index(g)
+
+    def already_played(self, a, b):
+        return bool(self.played[self.team_index[a.abbrev]] >> self.team_index[b.abbrev] & 1)
+
+    def game_for_team_in_week(self, abbrev, week):
+        return self.game_matrix[self.team_index[abbrev]][week - 1]
+
+    def games_for_team(self, abbrev):
+        return [g for g in self.game_matrix[self.team_index[abbrev]] if g is not None]
+
+    def opponent_in_week(self, abbrev, week):
+        i = self.team_index[abbrev]
+        g = self.game_matrix[i][week - 1]
+        if g is None:
+            return None
+        if g.is_bye:
+            return '*BYE*'
+        if self.home_matrix[i][week - 1]:
+            return g.away.abbrev
+        return '@' + g.home.abbrev
+
+    def has_bye(self, abbrev):
+        return self.bye_counts[self.team_index[abbrev]] > 0
+
+    def every_team_has_one_bye(self):
+        for team in self.teams:
+            if not self.has_bye(team):
+                return False
+        return True
+
+    def contains_matchup(self, abbrev1, abbrev2, mode=None):
+        i = self.team_index[abbrev1]
+        j = self.team_index[abbrev2]
+        if not self.played[i] >> j & 1:
+            return False
+        opponents = self.opponent_matrix[i]
+        for w in range(self.num_weeks):
+            if opponents[w] != j:
+                continue
+            is_home = self.home_matrix[i][w]
+            if mode != 'home' and not is_home:
+                return self.game_matrix[i][w]
+            if mode != 'away' and is_home:
+                return self.game_matrix[i][w]
+        return False
+
+    def max_consecutive_home_or_away_games(self, abbrev):
+        i = self.team_index[abbrev]
+        games = self.game_matrix[i]
+        homes = self.home_matrix[i]
+        max_consecutive = 0
+        consecutive_home = 0
+        consecutive_away = 0
+        for w in range(self.num_weeks):
+            g = games[w]
+            if g is None or g.is_bye:
+                continue
+            elif homes[w]:
+                consecutive_home += 1
+                consecutive_away = 0
+                max_consecutive = max(max_consecutive, consecutive_home)
+            else:
+                consecutive_away += 1
+                consecutive_home = 0
+                max_consecutive = max(max_consecutive, consecutive_away)
+        return max_consecutive
+
+    def home_game_count_for_team(self, abbrev):
+        return self.home_counts[self.team_index[abbrev]]
+
+    def is_away_in_week(self, abbrev, week):
+        i = self.team_index[abbrev]
+        g = self.game_matrix[i][week - 1]
+        return g is not None and not g.is_bye and not self.home_matrix[i][week - 1]
+
+    def is_home_in_week(self, abbrev, week):
+        i = self.team_index[abbrev]
+        g = self.game_matrix[i][week - 1]
+        return g is not None and not g.is_bye and self.home_matrix[i][week - 1]
+
+    def max_cross_over_games_for_any_team(self):
+        return max([self.league.constraints.cross_division_games(self, i)
+                    for i, d in enumerate(self.division_of) if d >= 0] or [0])
+
+    def validate_constraints(self):
+        """ Check the league rules compiled from its config (teams that
+            are never home, shared fields, field capacity, required
+            matchups, blackout weeks, cross-division games and crossover
+            quotas)
+        """
+        self.league.constraints.check(self)
+
+    def __repr__(self):
+        return "%s" % self.games
@@ -0,0 +1,274 @@
+import math
+
+from lib.errors import NoOrientationError
+
+
+def _home_bounds(schedule):
+    weeks = schedule.league.number_weeks
+    return int(math.floor(weeks / 2.0)), int(math.ceil(weeks / 2.0))
+
+
+class _Network:
+    """ A small flow network: nodes are integers, and each edge is stored
+        with its reverse at index ^ 1 so augmenting paths can undo flow.
+    """
+
+    def __init__(self, size):
+        self.adjacent = [[] for _ in range(size)]
+        self.heads = []
+        self.capacities = []
+
+    def add_edge(self, u, v, capacity):
+        """ Add an edge u -> v, returning its index """
+        self.adjacent[u].append(len(self.heads))
+        self.heads.append(v)
+        self.capacities.append(capacity)
+        self.adjacent[v].append(len(self.heads))
+        self.heads.append(u)
+        self.capacities.append(0)
+        return len(self.heads) - 2
+
+    def max_flow(self, source, sink):
+        """ Push as much flow as possible from source to sink along
+            shortest augmenting paths (Edmonds-Karp); returns the total
+        """
+        heads, capacities = self.heads, self.capacities
+        total = 0
+        while True:
+            via = [None] * len(self.adjacent)
+            via[source] = -1
+            queue = [source]
+            for u in queue:
+                for e in self.adjacent[u]:
+                    v = heads[e]
+                    if capacities[e] and via[v] is None:
+                        via[v] = e
+                        queue.append(v)
+                if via[sink] is not None:
+                    break
+            if via[sink] is None:
+                return total
+            pushed = None
+            v = sink
+            while v != source:
+                e = via[v]
+                pushed = capacities[e] if pushed is None else min(pushed, capacities[e])
+                v = heads[e ^ 1]
+            v = sink
+            while v != source:
+                e = via[v]
+                capacities[e] -= pushed
+                capacities[e ^ 1] += pushed
+                v = heads[e ^ 1]
+            total += pushed
+
+    def flow(self, e):
+        """ Flow on edge e (the residual capacity of its reverse) """
+        return self.capacities[e ^ 1]
+
+
+def orient_balanced(schedule, rng):
+    """ Choose home and away for every free game of a complete schedule
+        so every team that hosts games has between floor and ceil of
+        half the league's weeks as home games, or prove no choice can.
+
+        Byes do not count, and forced games and games against never-home
+        teams keep their venue.  Each free game must send one home game
+        to one of its teams, within each team's remaining bounds: a
+        flow with lower bounds, solved as a max flow from a super source
+        to a super sink.  Games are added in random order so different
+        candidates get different orientations.
+
+        Raises NoOrientationError if there is no balanced orientation.
+    """
+    lo, hi = _home_bounds(schedule)
+    team_list = schedule.team_list
+    n = len(team_list)
+    fixed = [0] * n
+    free = []
+    for g in schedule.games:
+        if g.is_bye:
+            continue
+        if g.forced or g.home.never_home or g.away.never_home:
+            fixed[schedule.team_index[g.home.abbrev]] += 1
+        else:
+            free.append(g)
+    rng.shuffle(free)
+
+    # nodes: source, sink, super source, super sink, games, teams
+    source, sink, super_source, super_sink = 0, 1, 2, 3
+    first_team = 4 + len(free)
+    network = _Network(first_team + n)
+    excess = [0] * (first_team + n)
+
+    def add(u, v, lower, upper):
+        excess[u] -= lower
+        excess[v] += lower
+        return network.add_edge(u, v, upper - lower)
+
+    choices = []
+    for k, g in enumerate(free):
+        add(source, 4 + k, 1, 1)
+        teams = [schedule.team_index[g.home.abbrev], schedule.team_index[g.away.abbrev]]
+        rng.shuffle(teams)
+        choices.append([(i, add(4 + k, first_team + i, 0, 1)) for i in teams])
+    for i, team in enumerate(team_list):
+        if team.is_pseudo_team_bye() or team.never_home:
+            continue
+        upper = hi - fixed[i]
+        if upper < 0:
+            raise NoOrientationError('%s has %s forced home games' % (team.abbrev, fixed[i]))
+        add(first_team + i, sink, max(0, lo - fixed[i]), upper)
+    network.add_edge(sink, source, len(free))
+
+    needed = 0
+    for node, e in enumerate(excess):
+        if e > 0:
+            network.add_edge(super_source, node, e)
+            needed += e
+        elif e < 0:
+            network.add_edge(node, super_sink, -e)
+    if network.max_flow(super_source, super_sink) < needed:
+        raise NoOrientationError('No balanced home/away orientation')
+
+    for g, choice in zip(free, choices):
+        for i, e in choice:
+            if network.flow(e) and team_list[i] is not g.home:
+                g.swap()
+    return free
+
+
+class _Violations:
+    """ Streak and field violations of a schedule: team-weeks past the
+        consecutive home/away limit, and weeks a field has more home
+        teams than it can host.
+    """
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.limit = schedule.league.max_consecutive_home_away_game_limit
+        self.constraints = schedule.league.constraints
+        self.teams = [t for t in schedule.teams
+                      if not schedule.teams[t].is_pseudo_team_bye() and not schedule.teams[t].never_home]
+
+    def streak_teams(self):
+        schedule = self.schedule
+        if not self.limit:
+            return []
+        return [t for t in self.teams if schedule.max_consecutive_home_or_away_games(t) > self.limit]
+
+    def field_teams(self):
+        """ Teams home in a week their field is overbooked """
+        schedule = self.schedule
+        constraints = self.constraints
+        teams = set()
+        for group_mask, capacity in constraints.fields:
+            for week in constraints.shared_field_weeks(schedule, group_mask, capacity):
+                teams.update(constraints.abbrevs(schedule.home_by_week[week - 1] & group_mask))
+        return sorted(teams)
+
+    def cost(self):
+        schedule = self.schedule
+        constraints = self.constraints
+        cost = 0
+        if self.limit:
+            for t in self.teams:
+                cost += max(0, schedule.max_consecutive_home_or_away_games(t) - self.limit)
+        for group_mask, capacity in constraints.fields:
+            cost += len(constraints.shared_field_weeks(schedule, group_mask, capacity))
+        return cost
+
+
+def _cycle(game, free_by_team, rng):
+    """ Games to flip with game so no team's home count changes: a
+        shortest path of free games from game's away team back to its
+        home team, each game leading from its home team to its away
+        team (so game and the path form a directed cycle).  Neighbours
+        are tried in random order; None if there is no such path.
+    """
+    start, goal = game.away.abbrev, game.home.abbrev
+    via = {start: None}
+    queue = [start]
+    for team in queue:
+        games = [g for g in free_by_team[team] if g.home.abbrev == team and g is not game]
+        rng.shuffle(games)
+        for g in games:
+            away = g.away.abbrev
+            if away in via:
+                continue
+            via[away] = g
+            if away == goal:
+                path = [game]
+                while via[away] is not None:
+                    path.append(via[away])
+                    away = via[away].home.abbrev
+                return path
+            queue.append(away)
+    return None
+
+
+def repair_streaks(schedule, free, rng, max_steps, noise=0.2):
+    """ Fix streaks past the limit and overbooked fields by flipping free
+        games of a balanced schedule, never breaking the balance: a move
+        flips one game whose teams both stay within bounds, or a directed
+        cycle of games through an offending team (see _cycle), which
+        leaves every home count as it was.  Each step takes the best move
+        for a random offending team, or (with probability noise, or when
+        nothing improves) a random one.
+
+        Returns True once nothing is violated, False after max_steps.
+    """
+    lo, hi = _home_bounds(schedule)
+    index = schedule.team_index
+    counts = schedule.home_counts
+    free_by_team = dict((t, []) for t in schedule.teams)
+    for g in free:
+        free_by_team[g.home.abbrev].append(g)
+        free_by_team[g.away.abbrev].append(g)
+    violations = _Violations(schedule)
+
+    def moves(team):
+        found = []
+        for g in free_by_team[team]:
+            if counts[index[g.home.abbrev]] > lo and counts[index[g.away.abbrev]] < hi:
+                found.append((g,))
+            cycle = _cycle(g, free_by_team, rng)
+            if cycle is not None:
+                found.append(cycle)
+        return found
+
+    cost = violations.cost()
+    for step in range(max_steps):
+        if cost == 0:
+            return True
+        offenders = violations.streak_teams() + violations.field_teams()
+        candidates = moves(rng.choice(offenders))
+        if not candidates:
+            continue
+        best, best_cost = None, None
+        if rng.random() >= noise:
+            for move in candidates:
+                for g in move:
+                    g.swap()
+                new_cost = violations.cost()
+                for g in move:
+                    g.swap()
+                if best_cost is None or new_cost < best_cost:
+                    best, best_cost = move, new_cost
+        if best is None or best_cost > cost:
+            best = rng.choice(candidates)
+        for g in best:
+            g.swap()
+        cost = violations.cost()
+    return cost == 0
+
+
+def orient_home_away(schedule, rng, max_steps):
+    """ Balance home/away exactly by flow (see orient_balanced), then
+        repair streaks and shared fields by local search (see
+        repair_streaks).  Returns True if the schedule is then balanced
+        and valid; raises NoOrientationError if no balanced orientation
+        exists.
+    """
+    free = orient_balanced(schedule, rng)
+    return repair_streaks(schedule, free, rng, max_steps)
@@ -0,0 +1,191 @@
+
+# Keys an override dict may use (see config.py)
+override_keys = frozenset((
+    'team', 'week', 'force_home', 'force_away', 'force_opponent', 'is_bye',
+    'avoid_opponents_this_week', 'avoid_opponent',
+))
+
+
+class ForcedGame:
+    """ A week-specific override, parsed: team must play in week, at home
+        (home=True), away (home=False), against opponent if set.  A forced
+        matchup with no venue given has the opponent at home.  avoid holds
+        the abbrevs team may not be drawn against in that week, and
+        avoid_mask the same teams as a bitmask (team i is bit 1 << i, in
+        the order of the teams dict).  source is the override dict and
+        position its place in the list of overrides.
+    """
+
+    def __init__(self, team, week, home, opponent=None, is_bye=False, avoid=frozenset(), source=None,
+                 position=None):
+        self.team = team
+        self.week = week
+        self.home = home
+        self.opponent = opponent
+        self.is_bye = is_bye
+        self.avoid = avoid
+        self.avoid_mask = 0
+        self.source = source
+        self.position = position
+
+    def home_team(self):
+        """ The team at home, if the venue is fixed: team when forced
+            home, the opponent of a forced matchup otherwise, else None
+        """
+        if self.home:
+            return self.team
+        return self.opponent
+
+    def __repr__(self):
+        venue = 'home' if self.home else 'away'
+        if self.opponent is not None:
+            return "<ForcedGame week %s - %s %s vs %s>" % (self.week, self.team, venue, self.opponent)
+        return "<ForcedGame week %s - %s %s>" % (self.week, self.team, venue)
+
+
+class AvoidedMatchup:
+    """ An avoid override, parsed: team and opponent may not meet in
+        week, or in any week if week is None.  source and position are
+        as for ForcedGame.
+    """
+
+    def __init__(self, team, opponent, week=None, source=None, position=None):
+        self.team = team
+        self.opponent = opponent
+        self.week = week
+        self.source = source
+        self.position = position
+
+    def __repr__(self):
+        if self.week is None:
+            return "<AvoidedMatchup %s vs %s>" % (self.team, self.opponent)
+        return "<AvoidedMatchup week %s - %s vs %s>" % (self.week, self.team, self.opponent)
+
+
+class OverrideIndex:
+    """ The overrides from config parsed once into typed records and
+        checked for mistakes, so generators never touch the raw dicts.
+
+        by_week[w] lists the ForcedGames of week w + 1 in config order;
+        avoided maps each team to the abbrevs it must never play (both
+        directions); avoid_by_week[w] maps each team to the abbrevs it may
+        not be drawn against in week w + 1 (avoided plus that week's
+        avoid_opponents_this_week), and avoid_masks_by_week[w] holds the
+        same as a bitmask per team index (in the order of the teams dict,
+        as in LeagueSchedule).  forced_of maps (abbrev, week) to the
+        ForcedGame a team is in that week, as team or opponent, and
+        avoids lists every AvoidedMatchup in config order.  Malformed or
+        conflicting overrides (unknown teams or keys, weeks outside the
+        season, is_bye without a forced opponent, a team forced into two
+        games in one week, a forced matchup that is also avoided) raise
+        ValueError.
+
+        positions numbers the overrides (default: their place in the
+        list); records keep the number of the override they came from, so
+        an index of a subset (see subset) can be traced back to the full
+        list.
+    """
+
+    def __init__(self, teams, number_weeks, overrides, positions=None):
+        self.teams = teams
+        self.number_weeks = number_weeks
+        self.overrides = [o for o in overrides if o is not None]
+        self.positions = list(range(len(self.overrides)) if positions is None else positions)
+        self.by_week = [[] for _ in range(number_weeks)]
+        self.avoids = []
+        self.avoided = dict((abbrev, set()) for abbrev in teams)
+        week_avoid = [dict((abbrev, set()) for abbrev in teams) for _ in range(number_weeks)]
+
+        def team(o, abbrev):
+            if abbrev not in teams:
+                raise ValueError('Unknown team %s in override %s' % (abbrev, o))
+            return teams[abbrev]
+
+        for position, o in zip(self.positions, self.overrides):
+            unknown = set(o) - override_keys
+            if unknown:
+                raise ValueError('Unknown keys %s in override %s' % (', '.join(sorted(unknown)), o))
+            if 'team' not in o:
+                raise ValueError('Override %s names no team' % o)
+            t = team(o, o['team'])
+            if o.get('avoid_opponent'):
+                a = team(o, o['avoid_opponent'])
+                if a is t:
+                    raise ValueError('Override %s avoids the team itself' % o)
+                self.avoided[t.abbrev].add(a.abbrev)
+                self.avoided[a.abbrev].add(t.abbrev)
+                self.avoids.append(AvoidedMatchup(t, a, source=o, position=position))
+
+            week = o.get('week')
+            forces = o.get('force_home') or o.get('force_away') or o.get('force_opponent')
+            if week is None:
+                if forces or o.get('avoid_opponents_this_week') or o.get('is_bye'):
+                    raise ValueError('Override %s needs a week' % o)
+                continue
+            if not isinstance(week, int) or not 1 <= week <= number_weeks:
+                raise ValueError('Override %s is not in weeks 1-%s' % (o, number_weeks))
+            if o.get('force_home') and o.get('force_away'):
+                raise ValueError('Override %s forces both home and away' % o)
+            if o.get('is_bye') and not o.get('force_opponent'):
+                raise ValueError('Override %s marks a bye but forces no opponent' % o)
+
+            for abbrev in o.get('avoid_opponents_this_week') or []:
+                a = team(o, abbrev)
+                week_avoid[week - 1][t.abbrev].add(abbrev)
+                week_avoid[week - 1][abbrev].add(t.abbrev)
+                self.avoids.append(AvoidedMatchup(t, a, week, source=o, position=position))
+            if not forces:
+                continue
+
+            opponent = team(o, o['force_opponent']) if o.get('force_opponent') else None
+            if opponent is t:
+                raise ValueError('Override %s forces a team to play itself' % o)
+            self.by_week[week - 1].append(ForcedGame(
+                t, week, bool(o.get('force_home')), opponent=opponent,
+                is_bye=bool(o.get('is_bye')), source=o, position=position))
+
+        self.forced_of = {}
+        for games in self.by_week:
+            for g in games:
+                for t in (g.team, g.opponent):
+                    if t is None:
+                        continue
+                    seen = self.forced_of.get((t.abbrev, g.week))
+                    if seen is not None:
+                        raise ValueError('%s is forced into two games in week %s: %s and %s' % (
+                            t.abbrev, g.week, seen.source, g.source))
+                    self.forced_of[t.abbrev, g.week] = g
+                if g.opponent is not None and g.opponent.abbrev in self.avoided[g.team.abbrev]:
+                    raise ValueError('Override %s forces a matchup that is avoided' % g.source)
+
+        # freeze the avoid set of every pick
+        self.avoided = dict((abbrev, frozenset(a)) for abbrev, a in self.avoided.items())
+        self.avoid_by_week = [
+            dict((abbrev, self.avoided[abbrev] | frozenset(a)) for abbrev, a in avoid.items())
+            for avoid in week_avoid]
+        index = dict((abbrev, i) for i, abbrev in enumerate(teams))
+        self.avoid_masks_by_week = [
+            [sum(1 << index[a] for a in avoid[abbrev]) for abbrev in teams]
+            for avoid in self.avoid_by_week]
+        for games in self.by_week:
+            for g in games:
+                g.avoid = self.avoid_by_week[g.week - 1][g.team.abbrev]
+                g.avoid_mask = self.avoid_masks_by_week[g.week - 1][index[g.team.abbrev]]
+
+    def subset(self, positions):
+        """ The index of only the overrides numbered in positions """
+        keep = set(positions)
+        chosen = [(p, o) for p, o in zip(self.positions, self.overrides) if p in keep]
+        return OverrideIndex(self.teams, self.number_weeks, [o for p, o in chosen], [p for p, o in chosen])
+
+    def week_only(self, week):
+        """ The index of a one-week season: the overrides of week, moved to
+            week 1, and the season-long ones
+        """
+        chosen = [(p, dict(o, week=1) if o.get('week') else o)
+                  for p, o in zip(self.positions, self.overrides) if o.get('week') in (None, week)]
+        return OverrideIndex(self.teams, 1, [o for p, o in chosen], [p for p, o in chosen])
+
+    def avoided_pairs(self):
+        """ The matchups never to be played, as sorted (abbrev, abbrev) pairs """
+        return sorted((a, b) for a, avoid in self.avoided.items() for b in avoid if a < b)
@@ -1,19 +1,18 @@
-import random
 from lib.errors import NoAvailableOpponnentError
 
 
-def pick_random_away_game_for_team(schedule, abbrev, sort_key=None):
+def pick_random_away_game_for_team(schedule, abbrev, rng, sort_key=None):
     games = []
-    for g in schedule.games:
+    for g in schedule.games_for_team(abbrev):
         if g.is_bye:
             continue
         if g.away.abbrev == abbrev:
             games.append(g)
     try:
         if sort_key is None:
-            random.shuffle(games)
+            rng.shuffle(games)
         else:
-            random.shuffle(games)
+            rng.shuffle(games)
             # XXX: too smart doesn't work
             #games = sorted(games, key=sort_key)
         return games.pop()
@@ -21,18 +20,18 @@ def pick_random_away_game_for_team(schedule, abbrev, sort_key=None):
         return None
 
 
-def pick_random_home_game_for_team(schedule, abbrev, sort_key=None):
+def pick_random_home_game_for_team(schedule, abbrev, rng, sort_key=None):
     games = []
-    for g in schedule.games:
+    for g in schedule.games_for_team(abbrev):
         if g.is_bye:
             continue
         if g.home.abbrev == abbrev:
             games.append(g)
     try:
         if sort_key is None:
-            random.shuffle(games)
+            rng.shuffle(games)
         else:
-            random.shuffle(games)
+            rng.shuffle(games)
             # XXX: too smart doesn't work
             #games = sorted(games, key=sort_key)
         return games.pop()
@@ -45,27 +44,39 @@ class Counter:
         self.value = 0
 
 
-pick_random_opponent_counter = Counter()
+def pick_random_opponent_index(schedule, i, eligible, rng, avoid=0):
+    """ Pick a uniformly random opponent for team index i among the
+        eligible teams (a bitmask of team indexes, as in the schedule's
+        team_index), skipping the avoided ones, those i has already
+        played and, if i already has a bye, the pseudo bye teams.
+        Draws one number from the given random.Random and returns the
+        opponent's index; the pick is counted in schedule.pick_counter.
+    """
+    schedule.pick_counter.value += 1
 
+    candidates = eligible & ~schedule.played[i] & ~avoid & ~(1 << i)
+    # HACK: XXX: checking for double bye...
+    if schedule.bye_counts[i]:
+        candidates &= ~schedule.bye_mask
+    if not candidates:
+        raise NoAvailableOpponnentError
+    for _ in range(rng.randrange(bin(candidates).count('1'))):
+        candidates &= candidates - 1
+    return (candidates & -candidates).bit_length() - 1
 
-def pick_random_opponent(team, eligible_teams, schedule, avoid_teams=None):
-    """ Pick a random opponent for the given team that has not yet
-        been played against in the given schedule.
-    """
-    # global pick_random_opponent_counter
-    pick_random_opponent_counter.value = pick_random_opponent_counter.value + 1
 
-    teams = list(eligible_teams.values())
-    random.shuffle(teams)
-    for t in teams:
-        if team.abbrev == t.abbrev:
-            continue
-        if avoid_teams and t.abbrev in avoid_teams:
-            continue
-        if schedule.already_played(team, t):
-            continue
-        # HACK: XXX: checking for double bye...
-        if t.is_pseudo_team_bye() and schedule.has_bye(team.abbrev):
-            continue
-        return t
-    raise NoAvailableOpponnentError
+def pick_random_opponent(team, eligible_teams, schedule, rng, avoid_teams=None):
+    """ Pick a random opponent for the given team among eligible_teams
+        (a dict of teams) that has not yet been played against in the
+        given schedule, drawing from the given random.Random instance.
+        See pick_random_opponent_index, which the generators call with
+        bitmasks directly.
+    """
+    index = schedule.team_index
+    eligible = 0
+    for abbrev in eligible_teams:
+        eligible |= 1 << index[abbrev]
+    avoid = 0
+    for abbrev in avoid_teams or ():
+        avoid |= 1 << index[abbrev]
+    return schedule.team_list[pick_random_opponent_index(schedule, index[team.abbrev], eligible, rng, avoid)]
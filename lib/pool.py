@@ -0,0 +1,143 @@
+import heapq
+
+from lib.anneal import Penalty
+
+
+# Relative weight of the soft terms valid schedules are ranked by
+quality_weights = dict(
+    streak=1,  # each game of a home/away run past two in a row
+    spread=2,  # most home games of a team minus the fewest
+    bye=1,     # each bye past the first in a week
+)
+
+
+def quality(schedule):
+    """ Soft score of a valid schedule, lower is better: it already
+        meets every rule, so this only prefers home and away games that
+        alternate, home games spread evenly over the teams, and byes
+        spread over the weeks.  Never-home teams count only for byes.
+    """
+    homed = [t for t, team in schedule.teams.items() if not team.is_pseudo_team_bye() and not team.never_home]
+    score = 0
+    for t in homed:
+        score += quality_weights['streak'] * max(0, schedule.max_consecutive_home_or_away_games(t) - 2)
+    if homed:
+        homes = [schedule.home_counts[schedule.team_index[t]] for t in homed]
+        score += quality_weights['spread'] * (max(homes) - min(homes))
+    byes = [0] * schedule.num_weeks
+    for g in schedule.games:
+        if g.is_bye and not (g.home.is_pseudo_team_bye() and g.away.is_pseudo_team_bye()):
+            byes[g.week - 1] += 1
+    score += quality_weights['bye'] * sum(max(0, n - 1) for n in byes)
+    return score
+
+
+def canonical_form(schedule):
+    """ The schedule up to the labels of the pseudo bye teams, as a
+        sorted tuple of (week, home, away) games ('' for the opponent of
+        a real team's bye): two schedules giving every real team the
+        same opponents, venues and bye weeks have the same form,
+        whichever pseudo team took a bye.
+    """
+    games = []
+    for g in schedule.games:
+        if g.is_bye:
+            for team in (g.home, g.away):
+                if not team.is_pseudo_team_bye():
+                    games.append((g.week, team.abbrev, ''))
+        else:
+            games.append((g.week, g.home.abbrev, g.away.abbrev))
+    return tuple(sorted(games))
+
+
+class SolutionPool:
+    """ The size best distinct valid schedules found so far, ranked by
+        quality score (see quality; ties go to the earlier one), plus the
+        best near miss: the complete schedule with the lowest penalty
+        (see lib/anneal.py) that still broke a rule.
+
+        Kept schedules sit in a heap whose root is the worst of them, so
+        a better schedule replaces it in O(log size).  A schedule whose
+        canonical form is already kept is a duplicate and is dropped.
+    """
+
+    def __init__(self, size=1):
+        self.size = size
+        self.heap = []
+        self.keys = set()
+        self.found = 0
+        self.duplicates = 0
+        self.near_miss = None
+        self.near_miss_penalty = None
+
+    def offer(self, schedule, valid=True):
+        """ Consider a complete schedule for the pool (or, if not valid,
+            as the near miss).  Returns False if it was a duplicate.
+        """
+        if not valid:
+            penalty = Penalty(schedule).total
+            if self.near_miss is None or penalty < self.near_miss_penalty:
+                self.near_miss = schedule
+                self.near_miss_penalty = penalty
+            return True
+
+        key = canonical_form(schedule)
+        if key in self.keys:
+            self.duplicates += 1
+            return False
+        self.found += 1
+        entry = (-quality(schedule), -self.found, key, schedule)
+        if len(self.heap) < self.size:
+            heapq.heappush(self.heap, entry)
+            self.keys.add(key)
+        elif entry > self.heap[0]:
+            worst = heapq.heapreplace(self.heap, entry)
+            self.keys.discard(worst[2])
+            self.keys.add(key)
+        return True
+
+    def full(self):
+        return len(self.heap) >= self.size
+
+    def ranked(self):
+        """ (quality score, schedule) of the kept schedules, best first """
+        return [(-entry[0], entry[3]) for entry in sorted(self.heap, reverse=True)]
+
+    def best(self):
+        """ The best valid schedule, or None """
+        ranked = self.ranked()
+        return ranked[0][1] if ranked else None
+
+    def state(self, encode):
+        """ The pool for a checkpoint, schedules encoded by encode """
+        return dict(
+            found=self.found,
+            duplicates=self.duplicates,
+            schedules=[[-entry[0], -entry[1], encode(entry[3])] for entry in self.heap],
+            near_miss=encode(self.near_miss) if self.near_miss is not None else None,
+            near_miss_penalty=self.near_miss_penalty,
+        )
+
+    def restore(self, state, decode):
+        """ Refill the pool from a checkpointed state, schedules rebuilt
+            by decode (canonical forms and scores are recomputed: forms
+            are not saved, and older checkpoints hold penalties)
+        """
+        for score, order, games in state['schedules']:
+            schedule = decode(games)
+            key = canonical_form(schedule)
+            entry = (-quality(schedule), -order, key, schedule)
+            if len(self.heap) < self.size:
+                heapq.heappush(self.heap, entry)
+                self.keys.add(key)
+            elif entry > self.heap[0]:
+                self.keys.discard(heapq.heapreplace(self.heap, entry)[2])
+                self.keys.add(key)
+        self.found = state['found']
+        self.duplicates = state['duplicates']
+        if state['near_miss'] is not None:
+            self.near_miss = decode(state['near_miss'])
+            self.near_miss_penalty = state['near_miss_penalty']
+
+    def __len__(self):
+        return len(self.heap)
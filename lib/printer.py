@@ -1,5 +1,6 @@
-
-def print_schedule(schedule):
+def format_schedule(schedule):
+    """ Render the schedule as a matrix, one line per (real) team """
+    lines = []
     teams = list(schedule.teams.values())
     teams.sort(key=lambda t: t.abbrev)
     for team in teams:
@@ -7,12 +8,17 @@ def print_schedule(schedule):
         if team.is_pseudo_team_bye():
             continue
         opponents = [schedule.opponent_in_week(ta, i+1) for i in range(schedule.num_weeks)]
-        unplayed = list(set(t for t in list(schedule.teams.keys()) if t != ta) - set(o.lstrip('@') for o in opponents))
+        unplayed = sorted(set(t for t in list(schedule.teams.keys()) if t != ta) - set(o.lstrip('@') for o in opponents))
         line = "%s:\t" % ta
         for opponent in opponents:
-            if opponent.startswith('BY'):
+            if opponent in schedule.teams and schedule.teams[opponent].is_pseudo_team_bye():
                 opponent = '*BYE*'
             line += "%s\t" % opponent
         line += "<" + ",".join(unplayed) + ">"
         line += "\t" + str(schedule.home_game_count_for_team(ta))
-        print(line)
\ No newline at end of file
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def print_schedule(schedule):
+    print(format_schedule(schedule))
@@ -1,88 +1,135 @@
-import random
-import sys
+import logging
 import math
-from config import number_weeks, debug, max_consecutive_home_away_game_limit
 from lib.picker import pick_random_away_game_for_team, pick_random_home_game_for_team
 
+log = logging.getLogger(__name__)
 
-def rebalance_home_away(schedule, max_iterations):
-    any_team_unbalanced = False
-    game_balance = number_weeks / 2.0  # XXX: doesn't support odd schedules
+
+class BalanceState:
+    """ Incrementally tracked home/away balance for the rebalancer.
+
+        Home counts come from the schedule's running counters; the
+        longest home/away streak is cached per team and refreshed only
+        for the two teams of a swapped game.  Teams touched by a swap
+        (plus their shared-field partners, from the compiled
+        constraints) are marked dirty, and only dirty teams are
+        re-checked on the next sweep.
+    """
+
+    def __init__(self, schedule, teams):
+        self.schedule = schedule
+        self.teams = teams
+        self.streaks = {}
+        for team in teams:
+            self.streaks[team] = schedule.max_consecutive_home_or_away_games(team)
+        self.dirty = set(teams)
+
+    def home_count(self, team):
+        return self.schedule.home_game_count_for_team(team)
+
+    def swap(self, game):
+        game.swap()
+        for team in (game.home.abbrev, game.away.abbrev):
+            if team not in self.streaks:
+                continue
+            self.streaks[team] = self.schedule.max_consecutive_home_or_away_games(team)
+            self.dirty.add(team)
+            constraints = self.schedule.league.constraints
+            partners = constraints.field_partners[self.schedule.team_index[team]]
+            if partners:
+                self.dirty.update(constraints.abbrevs(partners))
+
+    def take_dirty(self):
+        """ Return the dirty teams (in schedule order) and reset the set """
+        teams = [t for t in self.teams if t in self.dirty]
+        self.dirty.clear()
+        return teams
+
+
+def shared_home_weeks(schedule, team):
+    """ (week, teams home on the field) for each week in which a home
+        field team shares is overbooked
+    """
+    weeks = []
+    for field, capacity in schedule.league.constraints.fields_of[schedule.team_index[team]]:
+        for w, home in enumerate(schedule.home_by_week):
+            if bin(home & field).count('1') > capacity:
+                weeks.append((w + 1, home & field))
+    return weeks
+
+
+def rebalance_home_away(schedule, max_iterations, rng):
+    league = schedule.league
+    constraints = league.constraints
+    limit = league.max_consecutive_home_away_game_limit
+    game_balance = league.number_weeks / 2.0  # XXX: doesn't support odd schedules
     #balanced_home_counts = [int(game_balance)]
     balanced_home_counts = [
         int(math.ceil(game_balance)), int(math.floor(game_balance))]
 
-    for i in range(max_iterations):
-        if debug and (i % 1000 == 0):
-            print(".", end="")
-            sys.stdout.flush()
-
-        any_team_unbalanced = False
-        for team in schedule.teams:
-            # Byes don't matter
-            if team.startswith('BY'):  # BYE
-                continue
+    # Byes don't matter, nor do teams that are always away
+    teams = [t for t in schedule.teams
+             if not schedule.teams[t].is_pseudo_team_bye() and not schedule.teams[t].never_home]
+    state = BalanceState(schedule, teams)
 
-            home_count = int(schedule.home_game_count_for_team(team))
+    for i in range(max_iterations):
+        if league.debug and (i % 1000 == 0):
+            log.debug("Rebalancing iteration %s", i)
 
-            #print("%s - %s - %s" % (team, home_count, (home_count in [2, 3, 4])))
+        for team in state.take_dirty():
+            home_count = state.home_count(team)
 
             # Equal number of home/away ... now check more complex requirements
             if home_count in balanced_home_counts:
                 # Cannot not have more than 3 consecutive home/away
-                if max_consecutive_home_away_game_limit:
-                    max_consecutive = schedule.max_consecutive_home_or_away_games(
-                        team)
-                    if max_consecutive > max_consecutive_home_away_game_limit:
-                        any_team_unbalanced = True
-                        g1 = pick_random_home_game_for_team(schedule, team)
-                        g2 = pick_random_away_game_for_team(schedule, team)
+                if limit:
+                    if state.streaks[team] > limit:
+                        state.dirty.add(team)
+                        g1 = pick_random_home_game_for_team(schedule, team, rng)
+                        g2 = pick_random_away_game_for_team(schedule, team, rng)
                         if not g1.forced and not g2.forced:
-                            g1.swap()
-                            g2.swap()
-
-                # TAG/TAB cannot be both Home in same week (shared field)
-                if team == "TAG" or team == "TAB":
-                    g_home_weeks = map(lambda g: g.week,
-                                       filter(lambda g: g.home.abbrev == 'TAG' and not g.is_bye, schedule.games_for_team('TAG')))
-                    b_home_weeks = map(lambda g: g.week,
-                                       filter(lambda g: g.home.abbrev == 'TAB' and not g.is_bye, schedule.games_for_team('TAB')))
-                    shared_weeks = list(set(g_home_weeks) & set(b_home_weeks))
+                            state.swap(g1)
+                            state.swap(g2)
+
+                # Teams sharing a field cannot be both Home in same week
+                if constraints.field_partners[schedule.team_index[team]]:
+                    shared_weeks = shared_home_weeks(schedule, team)
                     if len(shared_weeks) > 0:
-                        # print("Fixing TAG/TAB sharing home in weeks %s" % shared_weeks)
-                        any_team_unbalanced = True
-                        rand_teams = ['TAG', 'TAB']
-                        random.shuffle(rand_teams)
-                        random.shuffle(shared_weeks)
+                        # print("Fixing shared field home in weeks %s" % shared_weeks)
+                        state.dirty.add(team)
+                        rng.shuffle(shared_weeks)
+                        week, home = shared_weeks[0]
+                        rand_teams = sorted(constraints.abbrevs(home))
+                        rng.shuffle(rand_teams)
                         g = schedule.game_for_team_in_week(
-                            rand_teams[0], shared_weeks[0])
+                            rand_teams[0], week)
                         if not g.forced:
-                            g.swap()
+                            state.swap(g)
 
                 continue
 
             # More or less than 4 home games ... try to rebalance
-            any_team_unbalanced = True
+            state.dirty.add(team)
 
             if home_count > math.ceil(game_balance):
                 for i in range(home_count - int(math.ceil(game_balance))):
                     # be smarter than "random"; try to find one of the opponents
                     # that has too few home games if possible
-                    g = pick_random_home_game_for_team(schedule, team,
+                    g = pick_random_home_game_for_team(schedule, team, rng,
                                                        sort_key=lambda game: schedule.home_game_count_for_team(game.away.abbrev))
                     if not g.forced:
-                        g.swap()
+                        state.swap(g)
 
             if home_count < math.floor(game_balance):
                 for i in range(home_count):
                     # be smarter than "random"; try to find one of the opponents
                     # that has too many home games if possible
-                    g = pick_random_away_game_for_team(schedule, team,
+                    g = pick_random_away_game_for_team(schedule, team, rng,
                                                        sort_key=lambda game: -1 * schedule.home_game_count_for_team(game.away.abbrev))
                     if g and not g.forced:
-                        g.swap()
+                        state.swap(g)
 
-        if not any_team_unbalanced:
+        if not state.dirty:
             return True
 
     return False
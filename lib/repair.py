@@ -0,0 +1,159 @@
+import math
+
+from lib.anneal import Penalty, _Moves
+from lib.errors import IterationError
+from lib.game import Game
+
+
+# Relative cost of the repair terms, on top of lib/anneal.py's penalty_weights
+repair_weights = dict(
+    override=50,  # each week override the schedule does not meet
+    change=1,     # each game that differs from the original schedule
+)
+
+
+class RepairPenalty(Penalty):
+    """ The annealing penalty plus the week overrides (and week-specific
+        avoided opponents) the schedule does not meet, and the number of
+        team-weeks whose opponent or venue differs from the original
+        schedule, so the search prefers the fewest changes.  Weeks up to
+        frozen_weeks are not checked: they cannot change.
+    """
+
+    def __init__(self, schedule, original, frozen_weeks):
+        override_index = schedule.league.override_index
+        self.original = [(list(opponents), list(homes))
+                         for opponents, homes in zip(original.opponent_matrix, original.home_matrix)]
+        self.weeks = range(frozen_weeks, schedule.num_weeks)
+        self.forced = [g for w in self.weeks for g in override_index.by_week[w]]
+        self.week_avoid = [(w + 1, a, b) for w in self.weeks
+                           for a, avoid in override_index.avoid_by_week[w].items()
+                           for b in avoid - override_index.avoided[a] if a < b]
+        super().__init__(schedule)
+
+    def rule_penalty(self):
+        return self.total - self.changes() * repair_weights['change']
+
+    def changes(self):
+        schedule = self.schedule
+        changed = 0
+        for i, (opponents, homes) in enumerate(self.original):
+            row, home_row = schedule.opponent_matrix[i], schedule.home_matrix[i]
+            for w in self.weeks:
+                if row[w] != opponents[w] or home_row[w] != homes[w]:
+                    changed += 1
+        return changed // 2
+
+    def unmet_overrides(self):
+        schedule = self.schedule
+        unmet = 0
+        for forced in self.forced:
+            g = schedule.game_for_team_in_week(forced.team.abbrev, forced.week)
+            if g is None:
+                unmet += 1
+                continue
+            is_home = g.home is forced.team
+            opponent = g.away if is_home else g.home
+            if forced.home and not is_home:
+                unmet += 1
+            elif not forced.home and is_home and not g.is_bye:
+                unmet += 1  # away, or a bye, will do
+            elif forced.opponent is not None and opponent is not forced.opponent:
+                unmet += 1
+        for week, a, b in self.week_avoid:
+            g = schedule.game_for_team_in_week(a, week)
+            if g is not None and b in (g.home.abbrev, g.away.abbrev):
+                unmet += 1
+        return unmet
+
+    def league_penalty(self):
+        return (super().league_penalty()
+                + repair_weights['override'] * self.unmet_overrides()
+                + repair_weights['change'] * self.changes())
+
+
+def copy_schedule(schedule):
+    """ A copy of the schedule with copies of its games """
+    copy = type(schedule)(schedule.league, schedule.pick_counter)
+    for g in schedule.games:
+        copy.add(Game(g.home, g.away, g.week, forced=g.forced, is_bye=g.is_bye))
+    return copy
+
+
+def _valid(schedule):
+    try:
+        schedule.validate_constraints()
+    except IterationError:
+        return False
+    return True
+
+
+def repair_schedule(original, frozen_weeks, rng, max_steps=20000, restarts=5,
+                    start_temperature=2.0, end_temperature=0.05):
+    """ Change as few games as possible of a valid schedule so it meets
+        the overrides again (after one was added or changed), keeping
+        the first frozen_weeks weeks exactly as they were.
+
+        Each restart anneals a copy of the original (see lib/anneal.py)
+        with every game of a frozen week marked forced, so no move can
+        touch it, and every other game free to move whatever its old
+        forced flag; the penalty adds unmet overrides and a cost per
+        changed game.  Returns the valid schedule with the fewest changes
+        seen, or None if no restart found a valid one.
+    """
+    best = None
+    best_changes = None
+    for restart in range(restarts):
+        schedule = copy_schedule(original)
+        for g in schedule.games:
+            g.forced = g.week <= frozen_weeks
+        penalty = RepairPenalty(schedule, original, frozen_weeks)
+        moves = _Moves(schedule, rng)
+        neighbourhood = [moves.flip] * 6 + [moves.swap_opponents] * 3 + [moves.swap_weeks]
+        cooling = (end_temperature / start_temperature) ** (1.0 / max(1, max_steps))
+        temperature = start_temperature
+
+        for i in range(max_steps):
+            if penalty.rule_penalty() == 0:
+                changes = penalty.changes()
+                if (best_changes is None or changes < best_changes) and _valid(schedule):
+                    best, best_changes = copy_schedule(schedule), changes
+                if changes <= 1:
+                    break
+            temperature *= cooling
+            move = rng.choice(neighbourhood)()
+            if move is None:
+                continue
+            touched, undo = move
+            before = penalty.total
+            delta = penalty.update(touched) - before
+            if delta > 0 and rng.random() >= math.exp(-delta / temperature):
+                undo()
+                penalty.update(touched)
+
+        if best_changes is not None and best_changes <= 1:
+            break
+
+    if best is not None:
+        forced = set((g.week, g.home.abbrev, g.away.abbrev) for g in original.games if g.forced)
+        for g in best.games:
+            g.forced = (g.week, g.home.abbrev, g.away.abbrev) in forced
+    return best
+
+
+def diff_schedules(old, new):
+    """ (week, team, old opponent, new opponent) for every real team
+        whose game changed, opponents as printed in the schedule matrix
+    """
+    if old is None or new is None:
+        raise ValueError('diff_schedules needs two schedules, got %r and %r' % (old, new))
+    changes = []
+    for week in range(1, old.num_weeks + 1):
+        for abbrev, team in sorted(old.teams.items()):
+            if team.is_pseudo_team_bye():
+                continue
+            before = old.opponent_in_week(abbrev, week)
+            after = new.opponent_in_week(abbrev, week)
+            if before != after:
+                changes.append((week, abbrev, before, after))
+    return changes
@@ -0,0 +1,345 @@
+import itertools
+
+from lib.errors import CannotFulfillOverride
+
+
+def berger_rounds(labels):
+    """ Circle method (Berger table) round robin over an even number of
+        labels.  Returns len(labels) - 1 rounds, each a list of pairs,
+        in which every label meets every other label exactly once.
+    """
+    n = len(labels)
+    fixed = labels[0]
+    rotating = list(labels[1:])
+    rounds = []
+    for r in range(n - 1):
+        circle = [fixed] + rotating
+        rounds.append([(circle[i], circle[n - 1 - i]) for i in range(n // 2)])
+        rotating = rotating[-1:] + rotating[:-1]
+    return rounds
+
+
+def _bye_teams(pairs, pseudo):
+    """ Real teams paired with a pseudo (bye) team in the given round """
+    teams = []
+    for a, b in pairs:
+        if a in pseudo and b not in pseudo:
+            teams.append(b)
+        elif b in pseudo and a not in pseudo:
+            teams.append(a)
+    return teams
+
+
+def _find_merges(chosen, bye_teams, excess, played, fixed_pairs):
+    """ Find merges (round, x, y) turning two byes of one round into the
+        game x vs y, so that each team t loses exactly excess[t] byes.
+        Merged pairs must not already meet in the chosen rounds.  Returns
+        a list of merges, or None if there is no way to do it.
+    """
+    team = next((t for t, e in excess.items() if e > 0), None)
+    if team is None:
+        return []
+    for r in chosen:
+        if team not in bye_teams[r]:
+            continue
+        if any(team in pair for pair in fixed_pairs.get(r, ())):
+            continue
+        for partner in bye_teams[r]:
+            pair = frozenset((team, partner))
+            if partner == team or excess.get(partner, 0) <= 0 or pair in played:
+                continue
+            if any(partner in fixed for fixed in fixed_pairs.get(r, ())):
+                continue
+            excess[team] -= 1
+            excess[partner] -= 1
+            played.add(pair)
+            bye_teams[r].remove(team)
+            bye_teams[r].remove(partner)
+            rest = _find_merges(chosen, bye_teams, excess, played, fixed_pairs)
+            bye_teams[r].extend((team, partner))
+            played.discard(pair)
+            excess[team] += 1
+            excess[partner] += 1
+            if rest is not None:
+                return [(r, team, partner)] + rest
+    return None
+
+
+class _CrossoverLimits:
+    """ The cross-division limit and crossover quotas of a league
+        (lib/constraints.py), checked on the pairs of round robin rounds
+    """
+
+    def __init__(self, constraints):
+        self.division = dict((t, d) for t, d in zip(constraints.teams, constraints.division_of) if d >= 0)
+        self.most = constraints.max_cross_division_games
+        self.quota = constraints.crossover_limit
+
+    def count(self, pairs):
+        """ Games of each team against each other division, keyed (team, division) """
+        division = self.division
+        counts = {}
+        for a, b in pairs:
+            if a in division and b in division and division[a] != division[b]:
+                counts[a, division[b]] = counts.get((a, division[b]), 0) + 1
+                counts[b, division[a]] = counts.get((b, division[a]), 0) + 1
+        return counts
+
+    def fits(self, all_counts):
+        """ True if the games counted in all_counts together keep every
+            team within its limits
+        """
+        total = {}
+        for counts in all_counts:
+            for key, count in counts.items():
+                total[key] = total.get(key, 0) + count
+        cross = {}
+        for (t, d), count in total.items():
+            limit = self.quota[self.division[t]][d]
+            if limit is not None and count > limit:
+                return False
+            cross[t] = cross.get(t, 0) + count
+        return self.most is None or all(count <= self.most for count in cross.values())
+
+
+def _division_labels(team_abbrevs, constraints, rng):
+    """ Labels for the circle method with the teams of each division
+        (and the bye teams) next to each other, so that most rounds pair
+        teams of one division; the order within and of the divisions is
+        random
+    """
+    groups = {}
+    for t, d in zip(constraints.teams, constraints.division_of):
+        groups.setdefault(d, []).append(t)
+    blocks = [groups[d] for d in sorted(groups)]
+    for block in blocks:
+        rng.shuffle(block)
+    rng.shuffle(blocks)
+    labels = [t for block in blocks for t in block if t in team_abbrevs]
+    turn = rng.randrange(len(labels))
+    return labels[turn:] + labels[:turn]
+
+
+def _fitting_combinations(candidates, count, pinned_counts, round_counts, crossovers, limit,
+                          byes=None, round_byes=None):
+    """ The combinations of count candidate rounds, in the order of
+        itertools.combinations, whose games (with those counted in
+        pinned_counts) keep within crossovers and, if byes is given,
+        which give a bye to every team in it (round_byes[r] holds the
+        teams with a bye in round r).  Since adding a round only adds
+        games and byes, a prefix that breaks a limit, or that the rounds
+        left cannot complete with byes, is not extended.  Stops after
+        trying limit rounds.
+    """
+    tried = [0]
+    left = [set() for _ in range(len(candidates) + 1)]
+    if byes is not None:
+        for i in range(len(candidates) - 1, -1, -1):
+            left[i] = left[i + 1] | set(round_byes[candidates[i]])
+
+    def extend(start, chosen, counts, missing):
+        if len(chosen) == count:
+            if not missing:
+                yield list(chosen)
+            return
+        for i in range(start, len(candidates) - (count - len(chosen)) + 1):
+            tried[0] += 1
+            if tried[0] > limit or not missing <= left[i]:
+                return
+            r = candidates[i]
+            if crossovers.fits(counts + [round_counts[r]]):
+                chosen.append(r)
+                for combo in extend(i + 1, chosen, counts + [round_counts[r]], missing - set(round_byes[r])
+                                    if byes is not None else missing):
+                    yield combo
+                chosen.pop()
+    return extend(0, [], pinned_counts, set(byes or ()))
+
+
+def _select_rounds(rounds, pinned, candidates, count, real_teams, pseudo, fixed_pairs, avoid_pairs, require_bye, rng, limit,
+                   crossovers=None):
+    """ Choose count of the candidate rounds to go with the pinned ones.
+        If require_bye, the choice must give every real team at least one
+        bye, with any extra byes removable by merges.  With crossovers (a
+        _CrossoverLimits), rounds with fewer cross-division games are
+        tried first, and the games of the chosen rounds, merges included,
+        must keep within the limits.  Returns the chosen rounds (in
+        random order) and the merges, or (None, None).
+    """
+    candidates = list(candidates)
+    rng.shuffle(candidates)
+    bye_teams = [_bye_teams(pairs, pseudo) for pairs in rounds]
+    if crossovers is None:
+        combos = itertools.islice(itertools.combinations(candidates, count), limit)
+    else:
+        round_counts = [crossovers.count(pairs) for pairs in rounds]
+        candidates.sort(key=lambda r: sum(round_counts[r].values()))
+        byes = None
+        if require_bye:
+            byes = set(real_teams) - set(t for r in pinned for t in bye_teams[r])
+        combos = _fitting_combinations(candidates, count, [round_counts[r] for r in pinned],
+                                       round_counts, crossovers, limit, byes, bye_teams)
+    for combo in combos:
+        combo = list(combo)
+        chosen = list(pinned) + combo
+        if not require_bye:
+            return combo, []
+        byes = dict((t, 0) for t in real_teams)
+        for r in chosen:
+            for t in bye_teams[r]:
+                byes[t] += 1
+        if 0 in byes.values():
+            continue
+        # merging must not create a repeated or an avoided matchup
+        played = set(frozenset(p) for r in chosen for p in rounds[r]) | set(avoid_pairs)
+        excess = dict((t, c - 1) for t, c in byes.items() if c > 1)
+        merges = _find_merges(chosen, [list(t) for t in bye_teams], excess, played, fixed_pairs)
+        if merges is not None and crossovers is not None and not crossovers.fits(
+                [round_counts[r] for r in chosen] + [crossovers.count((x, y) for r, x, y in merges)]):
+            continue
+        if merges is not None:
+            rng.shuffle(combo)
+            return combo, merges
+    return None, None
+
+
+def round_robin_games(team_abbrevs, bye_teams, number_weeks, override_index, rng, require_bye=True,
+                      max_attempts=100, max_round_choices=2000, constraints=None):
+    """ Build a complete pairing for every week from a randomized circle
+        method round robin over all teams, including the pseudo bye teams
+        (bye_teams, the teams with the Team bye flag).  Team labels and rounds are permuted until every forced
+        matchup lands on its week, avoided matchups are left out, and (if
+        require_bye) every real team ends up with exactly one bye.  Extra
+        byes are removed by pairing up two teams that sit out the same
+        week and have not met otherwise.  With constraints, a team's
+        blackout week gets a round in which it meets a bye team, the
+        rounds of required matchups are always among those chosen, and
+        rounds that would take a team past a cross-division limit or
+        crossover quota are not.  When the league limits crossovers, the
+        table is laid out division by division, which keeps most of its
+        rounds within divisions.
+
+        Returns a list of (home, away, week, forced, is_bye) tuples, with
+        home/away picked at random unless an override fixes the venue.
+        Raises CannotFulfillOverride if no permutation was found.
+    """
+    if len(team_abbrevs) % 2:
+        raise ValueError('Round robin needs an even number of teams (add a BY team)')
+    if number_weeks > len(team_abbrevs) - 1:
+        raise ValueError('Cannot play %s weeks without repeating a matchup' % number_weeks)
+
+    forced_pairs = [g for games in override_index.by_week for g in games if g.opponent is not None]
+    avoid_pairs = [frozenset(p) for p in override_index.avoided_pairs()]
+    pseudo = set(bye_teams)
+    real_teams = [t for t in team_abbrevs if t not in pseudo]
+    blackout, required_pairs = [], []
+    if constraints is not None:
+        blackout = [(t, w + 1) for w, mask in enumerate(constraints.blackout[:number_weeks])
+                    for t in sorted(constraints.abbrevs(mask))]
+        required_pairs = [frozenset((constraints.teams[i], constraints.teams[j]))
+                          for i, j in constraints.required_pairs]
+
+    crossovers = None
+    if constraints is not None and constraints.limits_crossovers:
+        crossovers = _CrossoverLimits(constraints)
+
+    for attempt in range(max_attempts):
+        if crossovers is None:
+            labels = list(team_abbrevs)
+            rng.shuffle(labels)
+        else:
+            labels = _division_labels(team_abbrevs, constraints, rng)
+        rounds = berger_rounds(labels)
+        round_of = {}
+        for r, pairs in enumerate(rounds):
+            for a, b in pairs:
+                round_of[frozenset((a, b))] = r
+
+        # Forced matchups pin their (unique) round to their week, and so
+        # does a blackout, with one of the bye teams
+        pins = [(frozenset((g.team.abbrev, g.opponent.abbrev)), g.week) for g in forced_pairs]
+        pins.extend((frozenset((t, rng.choice(sorted(pseudo)))), w) for t, w in blackout)
+        round_for_week = {}
+        fixed_pairs = {}
+        ok = True
+        for pair, week in pins:
+            r = round_of[pair]
+            if round_for_week.get(week, r) != r:
+                ok = False
+                break
+            round_for_week[week] = r
+            fixed_pairs.setdefault(r, []).append(pair)
+        pinned = set(round_for_week.values())
+        if not ok or len(pinned) != len(round_for_week):
+            continue
+
+        excluded = set(round_of[p] for p in avoid_pairs)
+        required = set(round_of[p] for p in required_pairs) - pinned
+        if excluded & (pinned | required):
+            continue
+        candidates = [r for r in range(len(rounds)) if r not in excluded and r not in pinned and r not in required]
+        free_weeks = [w for w in range(1, number_weeks + 1) if w not in round_for_week]
+        if len(required) > len(free_weeks):
+            continue
+        chosen, merges = _select_rounds(rounds, pinned | required, candidates, len(free_weeks) - len(required),
+                                        real_teams, pseudo, fixed_pairs, avoid_pairs, require_bye, rng,
+                                        max_round_choices, crossovers=crossovers)
+        if chosen is None:
+            continue
+        if required:
+            chosen = chosen + sorted(required)
+            rng.shuffle(chosen)
+        for w, r in zip(free_weeks, chosen):
+            round_for_week[w] = r
+
+        week_of_round = dict((r, w) for w, r in round_for_week.items())
+        weeks = [list(rounds[round_for_week[w]]) for w in range(1, number_weeks + 1)]
+        for r, x, y in merges:
+            pairs = weeks[week_of_round[r] - 1]
+            for p in [p for p in pairs if x in p or y in p]:
+                pairs.remove(p)
+            pairs.append((x, y))
+
+        games = orient_pairings(weeks, override_index, rng)
+        if games is not None:
+            return games
+
+    raise CannotFulfillOverride('No round robin permutation satisfies the overrides')
+
+
+def orient_pairings(weeks, override_index, rng):
+    """ Turn weekly pairings (a list of (a, b) pairs per week) into
+        (home, away, week, forced, is_bye) games, applying the venues of
+        the forced games in override_index (lib/overrides.py).  Returns
+        None if a week-specific override is violated.
+    """
+    games = []
+    for i, pairs in enumerate(weeks):
+        week = i + 1
+        avoid = override_index.avoid_by_week[i]
+        for a, b in pairs:
+            if rng.random() < 0.5:
+                a, b = b, a
+            if b in avoid.get(a, ()):
+                return None
+            forced_home, forced, is_bye = None, False, False
+            for team, opponent in ((a, b), (b, a)):
+                g = override_index.forced_of.get((team, week))
+                if g is None:
+                    continue
+                if g.opponent is not None and opponent not in (g.team.abbrev, g.opponent.abbrev):
+                    return None
+                forced = True
+                is_bye = is_bye or g.is_bye
+                home = g.home_team()
+                if home is None:
+                    wanted = opponent  # forced away, without a named opponent
+                else:
+                    wanted = home.abbrev
+                if forced_home not in (None, wanted):
+                    return None
+                forced_home = wanted
+            if forced_home == b:
+                a, b = b, a
+            games.append((a, b, week, forced, is_bye))
+    return games
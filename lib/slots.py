@@ -0,0 +1,147 @@
+# Kickoff times a field offers on a game day, unless it lists its own
+default_slots = ('9:00 AM', '10:30 AM', '12:00 PM', '1:30 PM', '3:00 PM', '4:30 PM', '6:00 PM')
+
+
+def minutes(time):
+    """ Minutes after midnight of a time like '1:30 PM' """
+    clock, half = time.split()
+    hour, minute = clock.split(':')
+    return int(hour) % 12 * 60 + int(minute) + (720 if half.upper() == 'PM' else 0)
+
+
+def clock(minutes):
+    """ The time minutes after midnight as SportsEngine imports have
+        always had it: '09:00 AM' (morning hours zero-padded), '1:30 PM'
+    """
+    hour, minute = divmod(minutes, 60)
+    if hour < 12:
+        return '%02d:%02d AM' % ((hour - 1) % 12 + 1, minute)
+    return '%d:%02d PM' % ((hour - 1) % 12 + 1, minute)
+
+
+class Field:
+    """ A home site: the kickoff times it offers each game day, how
+        long a slot lasts (minutes) and its capacity, the most bookings
+        it can host in one day (default: one per slot).  Capacity counts
+        levels, not matchups: a B division matchup is two bookings (B
+        Varsity and B JV), a D division one.  Teams sharing a site share
+        one Field, so their home games are booked around each other.
+    """
+
+    def __init__(self, name, slots=default_slots, length=90, capacity=None, address=None, url=None):
+        self.name = name
+        self.starts = sorted(minutes(s) for s in slots)
+        self.length = length
+        self.capacity = len(self.starts) if capacity is None else capacity
+        self.address = address
+        self.url = url
+
+    def slot_at(self, time):
+        """ Index of the first slot starting at or after time (minutes) """
+        for i, start in enumerate(self.starts):
+            if start >= time:
+                return i
+        return len(self.starts) - 1
+
+    def __repr__(self):
+        return self.name
+
+
+class Level:
+    """ One game of a matchup between two clubs in a division (e.g. B
+        Varsity), with the kickoff it is usually given.  The levels of a
+        division are played back to back, in the order listed.
+    """
+
+    def __init__(self, name, division, kickoff, event_type=None, key=None):
+        self.name = name
+        self.division = division
+        self.kickoff = minutes(kickoff)
+        self.event_type = event_type or name
+        self.key = key
+
+    def __repr__(self):
+        return self.name
+
+
+class Booking:
+    """ A level of a game booked into a slot of the home team's field """
+
+    def __init__(self, level, week, home, away, field, start, end):
+        self.level = level
+        self.week = week
+        self.home = home
+        self.away = away
+        self.field = field
+        self.start = start
+        self.end = end
+
+    def __repr__(self):
+        return "<Booking week %s %s - %s @ %s, %s %s>" % (
+            self.week, self.level, self.away, self.home, self.field, clock(self.start))
+
+
+def _block_order(preferred, count):
+    """ Slot indexes to try a block in: the preferred one, then later
+        and earlier ones alternately, nearest first
+    """
+    yield preferred
+    for distance in range(1, count):
+        if preferred + distance < count:
+            yield preferred + distance
+        if preferred - distance >= 0:
+            yield preferred - distance
+
+
+def allocate_slots(games, levels, field_of):
+    """ Book every level of every game into a slot of its home field.
+
+        games is an iterable of (division, week, home club, away club);
+        levels maps a division to its Levels; field_of maps a club to
+        its Field.  Each game day of a field keeps a bitmap of its
+        booked slots, so a game's levels go in the free run of slots
+        nearest their usual kickoff in one mask test per position; when
+        two clubs sharing a field are both home (a doubleheader) the
+        later game moves to the nearest free run, or is split over
+        single free slots when no run is left.
+
+        Yields the Bookings in the order of games, so games can be
+        streamed through; raises ValueError when a field has no room
+        left for a game that day.
+    """
+    booked = {}
+    counts = {}
+    for division, week, home, away in games:
+        game_levels = levels[division]
+        if home not in field_of:
+            raise ValueError('No home field known for %s' % home)
+        field = field_of[home]
+        day = (field.name, week)
+        used = booked.get(day, 0)
+        count = len(field.starts)
+        if counts.get(day, 0) + len(game_levels) > field.capacity:
+            raise ValueError('%s cannot host the %s levels of %s @ %s (%s) in week %s: %s of %s booked already' % (
+                field, len(game_levels), away, home, division, week, counts.get(day, 0), field.capacity))
+
+        slots = None
+        run = (1 << len(game_levels)) - 1
+        preferred = max(0, min(field.slot_at(game_levels[0].kickoff), count - len(game_levels)))
+        if len(game_levels) <= count:
+            for first in _block_order(preferred, count - len(game_levels) + 1):
+                if not used & run << first:
+                    slots = list(range(first, first + len(game_levels)))
+                    break
+        if slots is None:
+            free = [i for i in range(count) if not used >> i & 1]
+            if len(free) < len(game_levels):
+                raise ValueError('%s has no free slot for %s @ %s (%s) in week %s' % (
+                    field, away, home, division, week))
+            free.sort(key=lambda i: abs(i - preferred))
+            slots = sorted(free[:len(game_levels)])
+
+        for level, i in zip(game_levels, slots):
+            used |= 1 << i
+            start = field.starts[i]
+            yield Booking(level, week, home, away, field, start, start + field.length)
+        booked[day] = used
+        counts[day] = counts.get(day, 0) + len(game_levels)
@@ -0,0 +1,516 @@
+import logging
+import random
+import time
+
+from lib.anneal import Penalty, anneal_schedule
+from lib.backtrack import backtrack_games
+from lib.byes import add_bye_if_needed
+from lib.checkpoint import rng_state, set_rng_state, encode_schedule
+from lib.errors import NoAvailableOpponnentError, IterationError, CannotFulfillOverride, BlackoutError, RepairError
+from lib.exact import ExactResult, cp_model, repair_exact, solve_exact
+from lib.game import Game
+from lib.league_schedule import LeagueSchedule
+from lib.orient import orient_home_away
+from lib.picker import Counter, pick_random_opponent_index
+from lib.printer import format_schedule
+from lib.rebalance import rebalance_home_away
+from lib.repair import diff_schedules, repair_schedule
+from lib.round_robin import round_robin_games
+from lib.telemetry import Telemetry
+
+
+log = logging.getLogger(__name__)
+
+
+def new_seed():
+    """ Pick a fresh seed for a run that was not given one """
+    return random.SystemRandom().randrange(2 ** 32)
+
+
+class Solver:
+    """ Schedules one league (see lib/league.py).  Everything a run
+        reads comes from the league and everything it counts is kept on
+        the solver or the telemetry passed in, so several solvers (for
+        the same or different leagues) can run in one process.
+
+        generators, local_searches and rebalancers map the names used in
+        the league settings (and on the command line) to the solver's
+        candidate generators and repair steps.
+    """
+
+    def __init__(self, league):
+        self.league = league
+        self.pick_counter = Counter()
+        self.generators = dict(
+            random=self.generate_random,
+            round_robin=self.generate_round_robin,
+            backtrack=self.generate_backtrack,
+        )
+        self.local_searches = dict(
+            anneal=self.anneal,
+        )
+        self.rebalancers = dict(
+            flow=self.flow,
+            sweep=self.sweep,
+        )
+
+    def new_schedule(self):
+        """ An empty LeagueSchedule of the league """
+        return LeagueSchedule(self.league, self.pick_counter)
+
+    def schedule_from_games(self, games):
+        """ Build a LeagueSchedule from (home, away, week, forced, bye) games """
+        teams = self.league.teams
+        schedule = self.new_schedule()
+        for home, away, week, forced, bye in games:
+            schedule.add(Game(teams[home], teams[away], week, forced=forced, is_bye=bye))
+        return schedule
+
+    def schedule_from_artifact(self, records):
+        """ Rebuild a LeagueSchedule from the game records written by
+            --output.  Byes are not written, so the real teams left
+            without a game in a week are given one against the pseudo bye
+            teams (against each other, once those run out).
+        """
+        teams = self.league.teams
+        abbrevs = dict(((team.club, team.division), abbrev) for abbrev, team in teams.items())
+        games = []
+        playing = [set() for _ in range(self.league.number_weeks)]
+        for r in records:
+            home = abbrevs[(r['home'], r['division'])]
+            away = abbrevs[(r['away'], r.get('away_division', r['division']))]
+            games.append((home, away, r['week'], r.get('forced', False), False))
+            playing[r['week'] - 1].update((home, away))
+        for w in range(self.league.number_weeks):
+            idle = [abbrev for abbrev, team in teams.items() if not team.is_pseudo_team_bye() and abbrev not in playing[w]]
+            pseudo = list(self.league.constraints.bye_teams)
+            while idle:
+                other = pseudo.pop(0) if pseudo else idle.pop()
+                games.append((idle.pop(0), other, w + 1, False, True))
+            while len(pseudo) > 1:
+                games.append((pseudo.pop(0), pseudo.pop(0), w + 1, False, True))
+        return self.schedule_from_games(games)
+
+    def repair(self, original, frozen_weeks, seed=None):
+        """ Re-solve a schedule after an override changed: anneal it (see
+            lib/repair.py), then, unless exact_backend is 'python' or
+            ortools is missing, have CP-SAT find the fewest changes that
+            keep the frozen weeks (see lib/exact.py).  Returns whichever
+            valid schedule changes fewer team-weeks; raises RepairError
+            if neither finds one.
+        """
+        league = self.league
+        if seed is None:
+            seed = new_seed()
+        log.info("Using seed %s", seed)
+        start = time.perf_counter()
+        repaired = repair_schedule(original, frozen_weeks, random.Random(seed))
+        if repaired is not None:
+            log.info("Annealing changed %s team-weeks in %.1fs",
+                     len(diff_schedules(original, repaired)), time.perf_counter() - start)
+
+        if cp_model is None or league.exact_backend == 'python':
+            if repaired is None:
+                raise RepairError("Annealing found no repair keeping weeks 1-%s (install ortools to solve it exactly)"
+                                  % frozen_weeks)
+            return repaired
+        start = time.perf_counter()
+        games = [(g.home.abbrev, g.away.abbrev, g.week, g.is_bye) for g in original.games]
+        result = repair_exact(league.constraints, league.override_index, league.require_bye,
+                              league.max_consecutive_home_away_game_limit, games, frozen_weeks,
+                              time_limit=league.exact_time_limit)
+        if result.status == 'feasible':
+            schedule = self.schedule_from_games(result.games)
+            error = self._rule_broken(schedule)
+            if error:
+                log.warning("The exact repair breaks a league rule: %s", error)
+            elif repaired is None or len(diff_schedules(original, schedule)) < len(diff_schedules(original, repaired)):
+                log.info("CP-SAT changed %s team-weeks in %.1fs",
+                         len(diff_schedules(original, schedule)), time.perf_counter() - start)
+                repaired = schedule
+        if repaired is None:
+            if result.status == 'infeasible':
+                raise RepairError("No schedule keeping weeks 1-%s meets the overrides (proven by CP-SAT)" % frozen_weeks)
+            raise RepairError("No repair keeping weeks 1-%s found in %ss" % (frozen_weeks, league.exact_time_limit))
+        return repaired
+
+    def generate_random(self, rng):
+        """ Generate the schedule randomly from the given random.Random,
+            returning an instance of LeagueSchedule.
+
+            Avoided matchups are never picked, a team sharing a home field
+            is made the away team when its field is already taken (or full)
+            that week, teams take their byes in their blackout weeks, and
+            matchups that would exceed the cross-division limit or a
+            crossover quota are skipped.  Teams left without a bye get one
+            afterwards from add_bye_if_needed.
+
+            Teams are picked by index: each week keeps a bitmask of the
+            teams not yet given a game, and opponents are drawn from it with
+            pick_random_opponent_index.
+
+            Note: the schedule returned here does not satisfy all constraints
+            (home/away balance, etc.) but can be used as a starting point.
+        """
+        league = self.league
+        constraints = league.constraints
+        override_index = league.override_index
+
+        schedule = self.new_schedule()
+        team_list = schedule.team_list
+        real_teams = [i for i, team in enumerate(team_list) if not team.is_pseudo_team_bye()]
+        all_teams = (1 << len(team_list)) - 1
+        check_cross_division = constraints.limits_crossovers
+
+        for i in range(league.number_weeks):
+            week = i + 1
+            unassigned = all_teams
+            avoid_masks = override_index.avoid_masks_by_week[i]
+
+            # Teams that cannot play this week take their bye first
+            blackout = constraints.blackout[i]
+            while blackout:
+                t = (blackout & -blackout).bit_length() - 1
+                blackout &= blackout - 1
+                try:
+                    o = pick_random_opponent_index(schedule, t, unassigned & constraints.bye_mask, rng)
+                except NoAvailableOpponnentError:
+                    raise BlackoutError('No bye for %s in week %s' % (team_list[t].abbrev, week), week=week)
+                schedule.add(Game(team_list[t], team_list[o], week, is_bye=True))
+                unassigned &= ~(1 << t | 1 << o)
+
+            for forced in override_index.by_week[i]:
+                team = forced.team
+                t = schedule.team_index[team.abbrev]
+                try:
+                    if not unassigned >> t & 1:
+                        raise CannotFulfillOverride(week=week)
+
+                    if forced.opponent is not None:
+                        opponent = forced.opponent
+                        o = schedule.team_index[opponent.abbrev]
+                        if not unassigned >> o & 1 or schedule.played[t] >> o & 1:
+                            raise CannotFulfillOverride(week=week)
+                        if forced.home:
+                            game = Game(team, opponent, week, forced=True, is_bye=forced.is_bye)
+                        else:
+                            game = Game(opponent, team, week, forced=True, is_bye=forced.is_bye)
+                        if not game.is_bye and constraints.field_taken(
+                                schedule, schedule.team_index[game.home.abbrev], week):
+                            raise CannotFulfillOverride(week=week)
+
+                    elif forced.home:
+                        if constraints.field_taken(schedule, t, week):
+                            raise CannotFulfillOverride(week=week)
+                        o = pick_random_opponent_index(schedule, t, unassigned, rng, avoid=forced.avoid_mask)
+                        game = Game(team, team_list[o], week, forced=True)
+
+                    else:
+                        # the opponent will be home, so skip any whose field is taken
+                        taken = 0
+                        rest = unassigned
+                        while rest:
+                            low = rest & -rest
+                            rest ^= low
+                            if constraints.field_taken(schedule, low.bit_length() - 1, week):
+                                taken |= low
+                        o = pick_random_opponent_index(schedule, t, unassigned, rng, avoid=forced.avoid_mask | taken)
+                        game = Game(team_list[o], team, week, forced=True)
+
+                    schedule.add(game)
+                    unassigned &= ~(1 << t | 1 << o)
+                except NoAvailableOpponnentError:
+                    raise NoAvailableOpponnentError(
+                        "Cannot find opponent for %s in week %s" % (team, week), week=week)
+
+            for t in real_teams:
+                if not unassigned >> t & 1:
+                    continue
+                team = team_list[t]
+                try:
+                    avoid = avoid_masks[t]
+                    if check_cross_division:
+                        avoid |= constraints.cross_division_avoid(schedule, t)
+                    o = pick_random_opponent_index(schedule, t, unassigned, rng, avoid=avoid)
+                    opponent = team_list[o]
+
+                    # Check for bye
+                    bye = bool(constraints.bye_mask >> o & 1)
+                    if not bye and constraints.field_taken(schedule, t, week):
+                        schedule.add(Game(opponent, team, week))
+                    else:
+                        schedule.add(Game(team, opponent, week, is_bye=bye))
+                    unassigned &= ~(1 << t | 1 << o)
+                except NoAvailableOpponnentError:
+                    raise NoAvailableOpponnentError(
+                        "Cannot find opponent for %s in week %s" % (team, week), week=week)
+
+        constraints.check_required_matchups(schedule)
+        return schedule
+
+    def generate_round_robin(self, rng):
+        """ Generate the schedule from a randomized round robin (see
+            lib/round_robin.py), returning an instance of LeagueSchedule.
+
+            Unlike the random generator, every schedule returned here is a
+            complete pairing with all matchup overrides, byes, blackout
+            weeks and required matchups satisfied; only home/away balance
+            is left to the rebalancer.
+        """
+        league = self.league
+        return self.schedule_from_games(round_robin_games(list(league.teams), league.constraints.bye_teams,
+                                                          league.number_weeks, league.override_index,
+                                                          rng, require_bye=league.require_bye,
+                                                          constraints=league.constraints))
+
+    def generate_backtrack(self, rng):
+        """ Generate the schedule by backtracking search (see
+            lib/backtrack.py), returning an instance of LeagueSchedule.
+
+            Dead ends undo only the last few picks instead of throwing the
+            whole candidate away; forced matchups are placed first and every
+            returned schedule has all matchup overrides, byes, blackout
+            weeks and required matchups satisfied.
+        """
+        league = self.league
+        return self.schedule_from_games(backtrack_games(list(league.teams), league.constraints.bye_teams,
+                                                        league.number_weeks, league.override_index,
+                                                        rng, require_bye=league.require_bye,
+                                                        constraints=league.constraints))
+
+    def anneal(self, schedule, rng):
+        return anneal_schedule(schedule, rng, self.league.max_local_search_steps)
+
+    def flow(self, schedule, rng):
+        return orient_home_away(schedule, rng, self.league.max_orient_repair_steps)
+
+    def sweep(self, schedule, rng):
+        return rebalance_home_away(schedule, self.league.max_rebalance_home_away_iterations, rng)
+
+    def solve_exact(self, backend=None, seed=0):
+        """ Solve the league exactly (see lib/exact.py) instead of
+            searching randomly: either find a schedule satisfying every
+            rule or prove that none exists and name the overrides that
+            conflict.
+
+            A schedule found is checked against the league rules before it
+            is returned; one that breaks a rule is reported as
+            'unverified' (see lib/exact.py) rather than returned.
+            Returns a (schedule, result) tuple; schedule is None unless
+            result.status is 'feasible'.
+        """
+        league = self.league
+        result = solve_exact(league.constraints, league.override_index, league.require_bye,
+                             league.max_consecutive_home_away_game_limit, backend=backend or league.exact_backend,
+                             time_limit=league.exact_time_limit, seed=seed)
+        if result.status != 'feasible':
+            return None, result
+        schedule = self.schedule_from_games(result.games)
+        error = self._rule_broken(schedule)
+        if error:
+            log.warning("The exact schedule breaks a league rule: %s", error)
+            return None, ExactResult('unverified', result.backend, error=error)
+        return schedule, result
+
+    def _rule_broken(self, schedule):
+        """ The league rule a finished schedule breaks, or None """
+        try:
+            schedule.validate_constraints()
+            penalty = Penalty(schedule).total
+            if penalty:
+                raise IterationError('penalty %s (home/away balance, streaks, byes or avoided matchups)' % penalty)
+        except IterationError as err:
+            return str(err)
+        return None
+
+    def make_schedule(self, seed=None, stop_event=None, generator=None, local_search=None, telemetry=None,
+                      rebalancer=None, progress_interval=None, pool=None, time_limit=None,
+                      max_attempts=None, checkpoint=None, resume=None, improve=False):
+        """ Run an iterative constraint solver to attempt to generate a set of
+            league schedules that satisfies all constraints.  The same seed
+            always reproduces the same run.
+
+            generator names the candidate generator to use (see generators);
+            local_search, if set, names the repair step (see local_searches)
+            used instead of the home/away rebalancer named by rebalancer
+            (see rebalancers).  Attempts, their outcomes and stage timings
+            are counted in telemetry (see lib/telemetry.py), if given.
+            Settings not given are the league's.
+
+            If a SolutionPool (see lib/pool.py) is given, every valid
+            schedule is offered to it and the search goes on until the pool
+            is full (or, if improve, on until it gives up, the pool keeping
+            the best schedules); complete schedules that are unbalanced or
+            break a rule are offered as near misses.  The search gives up
+            after max_attempts attempts or time_limit seconds, if set.
+
+            With a Checkpoint (see lib/checkpoint.py) the search state is
+            saved every checkpoint.interval seconds, when interrupted and at
+            the end; a saved state passed as resume carries the run on from
+            there (its seed, generator and local search win over the
+            arguments) and finds exactly what the uninterrupted run would.
+
+            Nothing is printed while searching: candidates and rejections are
+            logged at DEBUG level only, plus a progress heartbeat at INFO
+            level every progress_interval seconds, if set.
+            Returns a (schedule, attempts) tuple; schedule (the best in the
+            pool, if given) is None when no satisfactory schedule was found,
+            or when stop_event (shared with other solver processes) was set
+            before this one found a result.
+        """
+        league = self.league
+        if generator is None:
+            generator = league.generator
+        if local_search is None:
+            local_search = league.local_search
+        if rebalancer is None:
+            rebalancer = league.rebalancer
+        if progress_interval is None:
+            progress_interval = league.progress_interval
+        if max_attempts is None:
+            max_attempts = league.max_outer_loop_iterations
+        if resume is not None:
+            seed, generator, local_search = resume['seed'], resume['generator'], resume['local_search']
+            rebalancer = resume.get('rebalancer', 'sweep')
+        if seed is None:
+            seed = new_seed()
+        rng = random.Random(seed)
+        generate = self.generators[generator]
+        if telemetry is None:
+            telemetry = Telemetry()
+        telemetry.watch(self.pick_counter)
+        verbose = log.isEnabledFor(logging.DEBUG)
+        first = 0
+        if resume is not None:
+            set_rng_state(rng, resume['rng'])
+            first = resume['attempts']
+            telemetry.restore(resume['telemetry'])
+            if pool is not None and resume['pool'] is not None:
+                pool.restore(resume['pool'], self.schedule_from_games)
+            log.info("Resuming seed %s at attempt %s", seed, first)
+        else:
+            log.info("Using seed %s", seed)
+
+        def state(attempt, rng_state):
+            return dict(seed=seed, generator=generator, local_search=local_search, rebalancer=rebalancer,
+                        attempts=attempt, rng=rng_state, telemetry=telemetry.state(),
+                        pool=pool.state(encode_schedule) if pool is not None else None)
+
+        start = time.perf_counter()
+        next_progress = start + progress_interval if progress_interval else None
+        deadline = start + time_limit if time_limit else None
+        found = None
+        stopped = False
+        attempts = first
+        i = first
+        attempt_rng = rng_state(rng) if checkpoint is not None else None
+        try:
+            for i in range(first, max_attempts):
+                if stop_event is not None and stop_event.is_set():
+                    stopped = True
+                    log.info("Stopped after %s attempts", i)
+                    break
+                if deadline is not None and time.perf_counter() >= deadline:
+                    log.info("Time limit reached after %s attempts", i)
+                    break
+                if pool is not None and pool.full() and not improve:
+                    break
+                if checkpoint is not None:
+                    attempt_rng = rng_state(rng)
+                    if checkpoint.due():
+                        checkpoint.save(state(i, attempt_rng))
+                attempts = i + 1
+                telemetry.attempt()
+                if next_progress is not None and time.perf_counter() >= next_progress:
+                    elapsed = time.perf_counter() - start
+                    log.info("%s attempts in %.0fs (%.0f attempts/sec), rejected: %s",
+                             i, elapsed, i / elapsed, telemetry.outcomes)
+                    next_progress += progress_interval
+                try:
+                    with telemetry.stage('generate'):
+                        schedule = generate(rng)
+
+                    # Add byes in after we generate a schedule for any teams that didn't get one randomly assigned
+                    if league.require_bye:
+                        with telemetry.stage('bye_fix'):
+                            add_bye_if_needed(schedule)
+
+                    if verbose:
+                        log.debug("--- TENTATIVE DIVISION SCHEDULE ---\n%s", format_schedule(schedule))
+
+                    # Special requests not well modeled by other constraints/overrides
+                    # if not schedule.contains_matchup('TAL', 'PER') and not schedule.contains_matchup('TAL', 'HUD'):
+                    #    print("Missing Tallmadge vs Perry|Hudson. Will try again (attempt %s)" % i)
+                    #    continue
+
+                    # Everyone must have 1 and only 1 bye:
+                    if league.require_bye and not local_search and not schedule.every_team_has_one_bye():
+                        log.debug("Not everyone has a bye, will retry :(")
+                        telemetry.outcome('missing_bye')
+                        continue
+
+                    # Now try to balance home game count for each team
+                    if local_search:
+                        # ... or repair everything (balance, byes, pairings) in place
+                        log.debug("Now attempting to repair with local search...")
+                        with telemetry.stage('rebalance'):
+                            balanced = self.local_searches[local_search](schedule, rng)
+                    else:
+                        log.debug("Now attempting to re-balance home/away...")
+                        with telemetry.stage('rebalance'):
+                            balanced = self.rebalancers[rebalancer](schedule, rng)
+
+                    # Final verifications (home field overbooking, cross-over counts, ...)
+                    log.debug("Now checking league rules...")
+                    with telemetry.stage('validate'):
+                        try:
+                            schedule.validate_constraints()
+                        except IterationError:
+                            # complete, but breaks a rule: still a near miss
+                            if pool is not None:
+                                pool.offer(schedule, valid=False)
+                            raise
+
+                    if not balanced:
+                        if verbose:
+                            log.debug("--- UNBALANCED DIVISION SCHEDULE ---\n%s", format_schedule(schedule))
+                        log.debug("Unable to balance teams.  Will try again (attempt %s)", i)
+                        telemetry.outcome('unbalanced')
+                        if pool is not None:
+                            pool.offer(schedule, valid=False)
+                        continue
+
+                    if pool is not None and not pool.offer(schedule):
+                        log.debug("Found a schedule already in the pool (attempt %s)", i)
+                        telemetry.outcome('duplicate')
+                        continue
+
+                    log.info("Found schedule with seed %s (attempt %s)", seed, i)
+                    telemetry.outcome('solved')
+                    found = schedule
+                    if pool is None or (pool.full() and not improve):
+                        break
+                except IterationError as err:
+                    telemetry.failure(err)
+                    if str(err):
+                        log.debug('Error: %s', err)
+                    continue
+        except KeyboardInterrupt:
+            if checkpoint is not None and attempt_rng is not None:
+                # save the state the interrupted attempt started from
+                telemetry.attempts = i
+                checkpoint.save(state(i, attempt_rng))
+                log.warning("Interrupted; resume with --resume %s", checkpoint.path)
+            raise
+        if checkpoint is not None:
+            checkpoint.save(state(attempts, rng_state(rng)))
+
+        if pool is not None:
+            found = pool.best()
+        if found is None and not stopped:
+            log.warning("Cannot find satisfactory schedule")
+
+        log.info("{}M matches analyzed".format(
+            1.0*self.pick_counter.value/1000000.0))
+        telemetry.emit(final=True)
+        return found, attempts
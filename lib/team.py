@@ -1,13 +1,28 @@
 
 class Team:
-    """ Represents a team """
+    """ Represents a team.  A pseudo team standing in for a bye has the
+        bye flag set; a team that cannot host games has never_home set.
+        club is the program the team plays for (default: its abbrev);
+        the teams of a club share its home field across divisions.
+    """
 
-    def __init__(self, abbrev, division):
+    def __init__(self, abbrev, division, bye=False, never_home=False, club=None):
         self.abbrev = abbrev
         self.division = division 
+        self.bye = bye
+        self.never_home = never_home
+        self.club = club or abbrev
 
     def is_pseudo_team_bye(self):
-        return self.abbrev.startswith('BY') #BYE
+        return self.bye
 
     def __repr__(self):
-        return self.abbrev
\ No newline at end of file
+        return self.abbrev
+
+
+def division_teams(division, clubs):
+    """ The teams of one division for a league scheduling several
+        divisions at once, keyed CLUB-DIVISION (e.g. TAB-C)
+    """
+    return dict(('%s-%s' % (club, division), Team('%s-%s' % (club, division), division, club=club))
+                for club in clubs)
@@ -0,0 +1,106 @@
+import json
+import time
+
+from lib.picker import Counter
+
+
+# Stages of one solver attempt, timed separately
+stages = ('generate', 'bye_fix', 'rebalance', 'validate')
+
+
+class _Stage:
+    """ Context manager adding the time spent inside it to a stage """
+
+    def __init__(self, telemetry, name):
+        self.telemetry = telemetry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.telemetry.stage_seconds[self.name] += time.perf_counter() - self.start
+
+
+class Telemetry:
+    """ Counters for a solver run: attempts, the outcome of each attempt
+        (solved, or why the candidate was thrown away), the week
+        generation failed in, and the time spent in each stage.
+
+        If a stream is given, a snapshot is written to it as a JSON line
+        every interval seconds, and once more when the run is finished.
+        Matches analyzed are read from the pick counter of the solver
+        being watched (see watch).
+    """
+
+    def __init__(self, stream=None, interval=10.0):
+        self.stream = stream
+        self.interval = interval
+        self.start = self.last_emit = time.perf_counter()
+        self.attempts = 0
+        self.outcomes = {}
+        self.failure_weeks = {}
+        self.stage_seconds = dict((name, 0.0) for name in stages)
+        self.counter = Counter()
+        self.matches_start = 0
+
+    def watch(self, counter):
+        """ Count the matches analyzed from now on by the given counter """
+        self.counter = counter
+        self.matches_start = counter.value
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def attempt(self):
+        self.attempts += 1
+        if self.stream is not None and time.perf_counter() - self.last_emit >= self.interval:
+            self.emit()
+
+    def outcome(self, reason, week=None):
+        self.outcomes[reason] = self.outcomes.get(reason, 0) + 1
+        if week is not None:
+            self.failure_weeks[week] = self.failure_weeks.get(week, 0) + 1
+
+    def failure(self, err):
+        """ Record a candidate rejected with the given IterationError """
+        self.outcome(err.reason, err.week)
+
+    def snapshot(self, final=False):
+        elapsed = time.perf_counter() - self.start
+        return dict(
+            final=final,
+            elapsed=round(elapsed, 3),
+            attempts=self.attempts,
+            attempts_per_sec=round(self.attempts / elapsed, 1) if elapsed else None,
+            outcomes=dict(self.outcomes),
+            failure_weeks=dict((str(w), n) for w, n in sorted(self.failure_weeks.items())),
+            stage_seconds=dict((name, round(s, 3)) for name, s in self.stage_seconds.items()),
+            matches_analyzed=self.counter.value - self.matches_start,
+        )
+
+    def state(self):
+        """ The counters, for a checkpoint """
+        return dict(
+            elapsed=time.perf_counter() - self.start,
+            attempts=self.attempts,
+            outcomes=dict(self.outcomes),
+            failure_weeks=[[w, n] for w, n in self.failure_weeks.items()],
+            stage_seconds=dict(self.stage_seconds),
+            matches=self.counter.value - self.matches_start,
+        )
+
+    def restore(self, state):
+        """ Carry on counting from a checkpointed state """
+        self.start = time.perf_counter() - state['elapsed']
+        self.attempts = state['attempts']
+        self.outcomes = dict(state['outcomes'])
+        self.failure_weeks = dict((w, n) for w, n in state['failure_weeks'])
+        self.stage_seconds.update(state['stage_seconds'])
+        self.matches_start = self.counter.value - state['matches']
+
+    def emit(self, final=False):
+        self.last_emit = time.perf_counter()
+        if self.stream is not None:
+            self.stream.write(json.dumps(self.snapshot(final)) + '\n')
+            self.stream.flush()
@@ -1,18 +1,127 @@
-from multiprocessing import Process, Queue
-import subprocess
+# vim:filetype=python:fileencoding=utf-8
+"""
+Usage
 
+    python run_concurrent.py [--workers N] [--seed SEED] [--generator NAME]
+                             [--checkpoint PREFIX [--resume]]
 
-def f(q, pid):
-    print("Starting process {}".format(pid))
-    result = subprocess.run(['python3', 'schedule.py'], stdout=subprocess.PIPE)
-    print("Process {} finished".format(pid))
-    q.put(result.stdout)
+Runs the schedule solver in several worker processes at once, each with
+its own seed (SEED, SEED+1, ...).  As soon as any worker finds a valid
+schedule, every other worker is told to stop, and the winning schedule
+is printed along with the seed that reproduces it via schedule.py.
+With --checkpoint each worker saves its state to PREFIX.SEED now and
+then; run again with the same --seed and --resume to carry on.
+"""
 
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import time
 
-if __name__ == '__main__':
-    q = Queue()
+import config
+from lib.checkpoint import Checkpoint, load_checkpoint
+from lib.league import LeagueConfig
+from lib.solver import Solver, new_seed
+
+
+# The stop event shared by the workers of this process's pool (see
+# start_worker); an Event can only reach a worker when it is started
+stop_event = None
+
+
+def start_worker(event):
+    global stop_event
+    stop_event = event
+
+
+def solve(league, seed, generator, local_search, checkpoint_prefix=None, resume=False):
+    """ Worker task: solve the league with a Solver of its own, setting
+        the stop event once a schedule is found.  Returns the seed, the
+        winning schedule (or None), the attempt count and the seconds
+        taken.  With a checkpoint_prefix the worker checkpoints to
+        PREFIX.SEED (resuming from it if asked).
+    """
+    start = time.time()
+    checkpoint = state = None
+    if checkpoint_prefix:
+        path = '%s.%s' % (checkpoint_prefix, seed)
+        checkpoint = Checkpoint(path)
+        if resume and os.path.exists(path):
+            state = load_checkpoint(path)
+    schedule, attempts = Solver(league).make_schedule(seed=seed, stop_event=stop_event, generator=generator,
+                                                      local_search=local_search, checkpoint=checkpoint,
+                                                      resume=state)
+    if schedule is not None:
+        stop_event.set()
+    return seed, schedule, attempts, time.time() - start
 
-    for num in range(10):
-        Process(target=f, args=(q, num)).start()
 
-    print(q.get().decode('utf-8'))
+def run_concurrent(league, workers=None, seed=None, generator=None, local_search=None,
+                   checkpoint_prefix=None, resume=False):
+    """ Solve the league (see lib/league.py) in a pool of the given
+        number of worker processes (default: one per core), returning
+        the (seed, schedule) of the winner, or (None, None) if no worker
+        found a schedule.  If a worker raises, the others are stopped and
+        the exception is raised here.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if seed is None:
+        seed = new_seed()
+
+    event = multiprocessing.Event()
+    print("Starting %s workers with seeds %s-%s" % (workers, seed, seed + workers - 1))
+    start = time.time()
+    winner = (None, None)
+    total_attempts = 0
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=start_worker, initargs=(event,)) as pool:
+        futures = [pool.submit(solve, league, seed + n, generator, local_search, checkpoint_prefix, resume)
+                   for n in range(workers)]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                worker_seed, schedule, attempts, elapsed = future.result()
+                total_attempts += attempts
+                if schedule is not None and winner[1] is None:
+                    winner = (worker_seed, schedule)
+        except BaseException:
+            event.set()
+            raise
+
+    elapsed = time.time() - start
+    print("%s attempts in %.1fs across %s workers (%.0f attempts/sec)" % (
+        total_attempts, elapsed, workers, total_attempts / elapsed))
+    return winner
+
+
+if __name__ == '__main__':
+    league = LeagueConfig.from_module(config)
+    solver = Solver(league)
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[2])
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes (default: number of cores)')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the first worker; others use the following seeds')
+    parser.add_argument('--generator', choices=sorted(solver.generators), default=league.generator,
+                        help='how candidate schedules are generated (default: %(default)s)')
+    parser.add_argument('--local-search', choices=sorted(solver.local_searches), default=league.local_search,
+                        help='repair candidates by local search instead of rebalancing home/away')
+    parser.add_argument('--checkpoint', metavar='PREFIX',
+                        help='each worker saves its state to PREFIX.SEED every minute')
+    parser.add_argument('--resume', action='store_true',
+                        help='carry on from the --checkpoint files of an earlier run with the same --seed')
+    args = parser.parse_args()
+    if args.resume and (args.checkpoint is None or args.seed is None):
+        parser.error('--resume needs the --checkpoint and --seed of the earlier run')
+
+    seed, schedule = run_concurrent(league, workers=args.workers, seed=args.seed, generator=args.generator,
+                                    local_search=args.local_search, checkpoint_prefix=args.checkpoint,
+                                    resume=args.resume)
+    if schedule is None:
+        print("Cannot find satisfactory schedule")
+    else:
+        print("--- BALANCED DIVISION SCHEDULE ---")
+        schedule.print_schedule()
+        print("Found with seed %s (python schedule.py --seed %s --generator %s%s)" % (
+            seed, seed, args.generator,
+            ' --local-search %s' % args.local_search if args.local_search else ''))
@@ -1,8 +1,31 @@
 # vim:filetype=python:fileencoding=utf-8
-#
-# https://tallmadgeyouthfootball.sportngin.com/schedule_import
-# https://help.sportsengine.com/customer/portal/articles/619699
+"""
+Usage
+
+    python sportsengine_csv.py [--format {csv,json,ical}] [--output PATH]
+                               [--first-week MM/DD/YYYY] [--week-offset DIVISION=WEEKS]
+                               [ARTIFACT ...]
+
+Exports a season for SportsEngine: reads the schedules written by
+schedule.py --output (or, without any, the 2019 season below), books every
+home game into a time slot of its field, and writes the SportsEngine
+import rows (csv), a JSON list of games (json) or one iCal feed per team
+(ical).  Games stream through one at a time, so exporting many seasons
+and divisions does not hold every row in memory.
+
+https://tallmadgeyouthfootball.sportngin.com/schedule_import
+https://help.sportsengine.com/customer/portal/articles/619699
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
 
+from lib.artifact import read_games
+from lib.slots import Field, Level, allocate_slots, clock
 
 
 se_vars = dict(
@@ -35,6 +58,23 @@ teams = dict(
     TUS=['Tuslaw', 'Tuslaw Youth Field', 'https://www.google.com/maps/place/11881+Orrville+St+NW,+Massillon,+OH+44647/@40.838352,-81.5746997,17z/data=!3m1!4b1!4m5!3m4!1s0x883728ee684b943f:0x52637cbc5003c9e1!8m2!3d40.838352!4d-81.572511', '11881 Orrville St NW, Massillon'],
 )
 
+# One field per site; the teams of a site share it
+fields = {}
+field_of = {}
+for abbrev, (name, field, url, address) in teams.items():
+    if field not in fields:
+        fields[field] = Field(field, address=address, url=url)
+    field_of[abbrev] = fields[field]
+
+# The games of a matchup in each division, in kickoff order
+levels = dict(
+    B=[Level('B Varsity', 'B', '1:30 PM', 'Tackle - B Varsity', 'b_v'),
+       Level('B JV', 'B', '3:00 PM', 'Tackle - B JV', 'b_jv')],
+    C=[Level('C JV', 'C', '10:30 AM', 'Tackle - C JV', 'c_jv'),
+       Level('C Varsity', 'C', '12:00 PM', 'Tackle - C Varsity', 'c_v')],
+    D=[Level('D Team', 'D', '9:00 AM', 'Rookie Tackle - D Team', 'd')],
+)
+
 weeks = [
     '08/17/2019',
     '08/24/2019',
@@ -86,95 +126,209 @@ TAB	NRT	MAN	@ELL	@BAR	@NRT	SPR
 """
 
 
-# Handle B division (varsity and JV together)
-rows = [r for r in game_matrix_b_division.split('\n') if r.strip() != ""]
-for row in rows:
-    cells = row.split('\t')
-    home = cells[0]
-    for i, opp in enumerate(cells):
-        if i == 0:
-            continue
-        if '@' in opp:
-            continue
-        if opp == 'BYE':
-            continue
-        team_home = teams[home]
-        team_opp = teams[opp]
-        se_home = se_vars[home]
-        se_opp = se_vars[opp]
-        week = weeks[i - 1]
-
-        print(
-            week + '\t1:30 PM\t' + week + '\t3:00 PM\t' +
-            'B Varsity - ' + team_opp[0] + ' @ ' + team_home[0] + '\t' +
-            'Tackle - B Varsity\t' + team_home[1] + '\t' + team_home[2] + '\t' +
-            ' \tGAME\t \t' +
-            se_home['b_v'] + '\t \t1\t' + se_opp['b_v']
-        )
-        print(
-            week + '\t3:00 PM\t' + week + '\t4:30 PM\t' +
-            'B JV - ' + team_opp[0] + ' @ ' + team_home[0] + '\t' +
-            'Tackle - B JV\t' + team_home[1] + '\t' + team_home[2] + '\t' +
-            ' \tGAME\t \t' +
-            se_home['b_jv'] + '\t \t1\t' + se_opp['b_jv']
-        )
-
-# Handle C division (varsity and JV together)
-rows = [r for r in game_matrix_c_division.split('\n') if r.strip() != ""]
-for row in rows:
-    cells = row.split('\t')
-    home = cells[0]
-    for i, opp in enumerate(cells):
-        if i == 0:
+def matrix_games(division, matrix, week_offset=0):
+    """ Yield the game records of a schedule matrix as printed by
+        schedule.py (one row per team, @ marking away games)
+    """
+    for row in matrix.split('\n'):
+        if row.strip() == "":
             continue
-        if '@' in opp:
-            continue
-        if opp == 'BYE':
-            continue
-        team_home = teams[home]
-        team_opp = teams[opp]
-        se_home = se_vars[home]
-        se_opp = se_vars[opp]
-        week = weeks[i - 1]
-
-        print(
-            week + '\t12:00 PM\t' + week + '\t1:30 PM\t' +
-            'C Varsity - ' + team_opp[0] + ' @ ' + team_home[0] + '\t' +
-            'Tackle - C Varsity\t' + team_home[1] + '\t' + team_home[2] + '\t' +
-            ' \tGAME\t \t' +
-            se_home['c_v'] + '\t \t1\t' + se_opp['c_v']
-        )
-        print(
-            week + '\t10:30 AM\t' + week + '\t12:00 PM\t' +
-            'C JV - ' + team_opp[0] + ' @ ' + team_home[0] + '\t' +
-            'Tackle - C JV\t' + team_home[1] + '\t' + team_home[2] + '\t' +
-            ' \tGAME\t \t' +
-            se_home['c_jv'] + '\t \t1\t' + se_opp['c_jv']
-        )
-
-# Handle D division
-rows = [r for r in game_matrix_d_division.split('\n') if r.strip() != ""]
-for row in rows:
-    cells = row.split('\t')
-    home = cells[0]
-    for i, opp in enumerate(cells):
-        if i == 0:
-            continue
-        if '@' in opp:
-            continue
-        if opp == 'BYE':
-            continue
-        team_home = teams[home]
-        team_opp = teams[opp]
-        se_home = se_vars[home]
-        se_opp = se_vars[opp]
-        week = weeks[i] # note, D team starts 1 week delayed
-
-        print(
-            week + '\t09:00 AM\t' + week + '\t10:30 AM\t' +
-            'D Team - ' + team_opp[0] + ' @ ' + team_home[0] + '\t' +
-            'Rookie Tackle - D Team\t' + team_home[1] + '\t' + team_home[2] + '\t' +
-            ' \tGAME\t \t' +
-            se_home['d'] + '\t \t1\t' + se_opp['d']
-        )
+        cells = row.split('\t')
+        home = cells[0].rstrip(':')
+        for i, opp in enumerate(cells[1:]):
+            if '@' in opp or opp in ('BYE', '*BYE*') or opp.startswith('<'):
+                continue
+            if opp.strip() == "" or opp.isdigit():
+                continue
+            yield dict(division=division, week=i + 1 + week_offset, home=home, away=opp)
+
+
+def season_2019_games():
+    """ The 2019 season, from the matrices above """
+    yield from matrix_games('B', game_matrix_b_division)
+    yield from matrix_games('C', game_matrix_c_division)
+    yield from matrix_games('D', game_matrix_d_division, week_offset=1)  # note, D team starts 1 week delayed
+
+
+def offset_weeks(games, week_offsets):
+    """ Shift the games of each division by its offset in weeks (a
+        division starting later than the others)
+    """
+    for game in games:
+        offset = week_offsets.get(game['division'], 0)
+        if offset:
+            game = dict(game, week=game['week'] + offset)
+        yield game
+
+
+def unknown_clubs(games, levels=levels):
+    """ Clubs of the given game records the tables above cannot export:
+        no home field and name in teams, or no SportsEngine team id in
+        se_vars for a level they play
+    """
+    unknown = set()
+    for g in games:
+        keys = [level.key for level in levels.get(g['division'], ())]
+        for club in (g['home'], g['away']):
+            if club not in teams or any(key not in se_vars.get(club, {}) for key in keys):
+                unknown.add(club)
+    return sorted(unknown)
+
+
+def book_games(games, levels=levels, field_of=field_of):
+    """ Book every level of the given game records into a time slot of
+        the home field (see lib/slots.py), yielding the Bookings
+    """
+    return allocate_slots(((g['division'], g['week'], g['home'], g['away']) for g in games), levels, field_of)
+
+
+def sportsengine_rows(bookings, dates=weeks):
+    """ Yield a SportsEngine import row for every booking """
+    for booking in bookings:
+        team_home = teams[booking.home]
+        team_opp = teams[booking.away]
+        date = dates[booking.week - 1]
+        yield [
+            date, clock(booking.start), date, clock(booking.end),
+            booking.level.name + ' - ' + team_opp[0] + ' @ ' + team_home[0],
+            booking.level.event_type, booking.field.name, booking.field.url,
+            ' ', 'GAME', ' ',
+            se_vars[booking.home][booking.level.key], ' ', '1', se_vars[booking.away][booking.level.key],
+        ]
+
+
+def write_sportsengine(bookings, stream, dates=weeks):
+    """ Write the SportsEngine import (tab separated) row by row """
+    writer = csv.writer(stream, delimiter='\t', lineterminator='\n')
+    for row in sportsengine_rows(bookings, dates):
+        writer.writerow(row)
+
+
+def booking_record(booking, dates=weeks):
+    return dict(
+        date=dates[booking.week - 1], start=clock(booking.start), end=clock(booking.end),
+        level=booking.level.name, division=booking.level.division,
+        home=booking.home, away=booking.away,
+        field=booking.field.name, address=booking.field.address,
+    )
+
+
+def write_json(bookings, stream, dates=weeks):
+    """ Write the bookings as a JSON array, one booking at a time """
+    stream.write('[')
+    for i, booking in enumerate(bookings):
+        stream.write(',\n' if i else '\n')
+        stream.write(json.dumps(booking_record(booking, dates), sort_keys=True))
+    stream.write('\n]\n')
+
+
+def _ical_text(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ical_lines(lines):
+    """ Fold content lines to 75 octets and end them with CRLF """
+    for line in lines:
+        data = line.encode('utf-8')
+        while len(data) > 75:
+            cut = 75
+            while data[cut] & 0xC0 == 0x80:  # don't split a character
+                cut -= 1
+            yield data[:cut].decode('utf-8') + '\r\n'
+            data = b' ' + data[cut:]
+        yield data.decode('utf-8') + '\r\n'
+
+
+def ical_event(booking, dates=weeks, stamp=None):
+    """ The VEVENT lines of a booking; stamp (DTSTAMP) is when the feed
+        was written, in UTC (default: now)
+    """
+    if stamp is None:
+        stamp = datetime.datetime.now(datetime.timezone.utc)
+    day = datetime.datetime.strptime(dates[booking.week - 1], '%m/%d/%Y')
+    start = day + datetime.timedelta(minutes=booking.start)
+    end = day + datetime.timedelta(minutes=booking.end)
+    summary = '%s - %s @ %s' % (booking.level.name, teams[booking.away][0], teams[booking.home][0])
+    return [
+        'BEGIN:VEVENT',
+        'UID:%s-%s-%s-%s@tyf' % (start.strftime('%Y%m%d'), booking.level.key, booking.home, booking.away),
+        'DTSTAMP:%s' % stamp.strftime('%Y%m%dT%H%M%SZ'),
+        'DTSTART:%s' % start.strftime('%Y%m%dT%H%M%S'),
+        'DTEND:%s' % end.strftime('%Y%m%dT%H%M%S'),
+        'SUMMARY:%s' % _ical_text(summary),
+        'LOCATION:%s' % _ical_text('%s, %s' % (booking.field.name, booking.field.address)),
+        'END:VEVENT',
+    ]
+
+
+def write_ical(bookings, directory, dates=weeks):
+    """ Write one iCal feed per team (CLUB-LEVEL.ics, e.g. TAB-b_v.ics)
+        into directory, appending each booking to the feeds of both
+        teams as it comes
+    """
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.datetime.now(datetime.timezone.utc)
+    feeds = {}
+    try:
+        for booking in bookings:
+            event = list(_ical_lines(ical_event(booking, dates, stamp)))
+            for club in (booking.home, booking.away):
+                name = '%s-%s' % (club, booking.level.key)
+                if name not in feeds:
+                    feeds[name] = open(os.path.join(directory, name + '.ics'), 'w', newline='')
+                    feeds[name].writelines(_ical_lines([
+                        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//tyf//schedule//EN',
+                        'X-WR-CALNAME:%s' % _ical_text('%s %s' % (teams[club][0], booking.level.name)),
+                    ]))
+                feeds[name].writelines(event)
+    finally:
+        for feed in feeds.values():
+            feed.writelines(_ical_lines(['END:VCALENDAR']))
+            feed.close()
+
+
+writers = dict(
+    csv=write_sportsengine,
+    json=write_json,
+)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[2])
+    parser.add_argument('artifacts', nargs='*', metavar='ARTIFACT',
+                        help='schedules written by schedule.py --output (default: the 2019 season)')
+    parser.add_argument('--format', choices=sorted(writers) + ['ical'], default='csv',
+                        help='what to write (default: %(default)s)')
+    parser.add_argument('--output', metavar='PATH',
+                        help='file to write (default: stdout), or directory for ical feeds')
+    parser.add_argument('--first-week', metavar='MM/DD/YYYY',
+                        help='date of week 1; later weeks follow every 7 days (default: the 2019 dates)')
+    parser.add_argument('--week-offset', action='append', default=[], metavar='DIVISION=WEEKS',
+                        help='start a division later than week 1, e.g. D=1')
+    args = parser.parse_args()
+
+    dates = weeks
+    if args.first_week:
+        first = datetime.datetime.strptime(args.first_week, '%m/%d/%Y')
+        dates = [(first + datetime.timedelta(weeks=i)).strftime('%m/%d/%Y') for i in range(53)]
+    week_offsets = dict((d, int(n)) for d, n in (o.split('=') for o in args.week_offset))
+
+    def artifact_games():
+        for path in args.artifacts:
+            with open(path) as f:
+                yield from read_games(f)
 
+    if args.artifacts:
+        unknown = unknown_clubs(artifact_games())
+        if unknown:
+            parser.error('no field or SportsEngine team ids known for %s; add them to teams and se_vars '
+                         'in sportsengine_csv.py' % ', '.join(unknown))
+    games = artifact_games() if args.artifacts else season_2019_games()
+    bookings = book_games(offset_weeks(games, week_offsets))
+    if args.format == 'ical':
+        write_ical(bookings, args.output or 'ical', dates)
+    elif args.output:
+        with open(args.output, 'w', newline='') as f:
+            writers[args.format](bookings, f, dates)
+    else:
+        writers[args.format](bookings, sys.stdout, dates)